@@ -1,7 +1,7 @@
 # _Chinese_Learning_App(Main).py
 import streamlit as st
 from Modules.session import init_session_state
-from Modules.sheets import load_gs_data_cached
+from Modules.record_store import get_record_store
 from Modules import tab1_typo_checker, tab2_study, tab3_tts, tab4_revision, tab5_tools
 
 st.set_page_config(layout="wide")
@@ -29,7 +29,7 @@ def render_header():
         st.session_state.selected_model = model_option
     with col3:
         if st.button("Clear Google Sheets Cache"):
-            load_gs_data_cached.clear()
+            get_record_store().clear_cache()
             st.rerun()
 
 def main():
@@ -1,47 +1,253 @@
 # ai.py
 
+import asyncio, os, tempfile, time
 import streamlit as st
+from Modules.ai_cache import AIResponseCache
+from Modules.singleflight import FlightAbandoned, get_singleflight
+from Modules.ai_clients import (
+    AIClientManager, ProviderUnavailable, DEEPSEEK_BASE_URL, PROVIDER_MODELS, should_failover,
+)
 
 @st.cache_resource
-def _init_gemini_model():
-    import google.generativeai as genai
-    api_key = st.secrets.get("GEMINI_API_KEY")
-    if not api_key:
-        return None
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.5-flash")
+def get_client_manager() -> AIClientManager:
+    """Process-wide pooled provider clients (keys and base URL from secrets)."""
+    return AIClientManager(
+        gemini_api_key=st.secrets.get("GEMINI_API_KEY"),
+        deepseek_api_key=st.secrets.get("DEEPSEEK_API_KEY"),
+        deepseek_base_url=st.secrets.get("DEEPSEEK_BASE_URL", DEEPSEEK_BASE_URL),
+    )
+
+def _provider_error(provider: str, e) -> str:
+    if isinstance(e, ProviderUnavailable):
+        return f"❌ {e}"
+    if provider == "Gemini":
+        return _gemini_error(e)
+    return f"❌ API Error: {e}"
 
 def call_gemini(prompt: str) -> str:
-    model = _init_gemini_model()
-    if not model:
-        return "❌ Gemini API key not configured. Please set GEMINI_API_KEY in secrets."
     try:
-        resp = model.generate_content(prompt)
-        return resp.text
+        return get_client_manager().generate("Gemini", prompt)
     except Exception as e:
-        msg = str(e)
-        if "quota" in msg.lower() or "429" in msg:
-            return "⚠️ Gemini API quota used up for today. Please try again tomorrow or upgrade your plan."
-        return f"❌ Gemini API Error: {e}"
-
-def call_deepseek(prompt: str, model: str = "deepseek-chat") -> str:
-    api_key = st.secrets.get("DEEPSEEK_API_KEY")
-    if not api_key:
-        return "❌ DeepSeek API key not configured. Please set DEEPSEEK_API_KEY in secrets."
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role":"system","content":"You are a helpful assistant."},
-                      {"role":"user","content":prompt}],
-            stream=False
-        )
-        return resp.choices[0].message.content
+        return _provider_error("Gemini", e)
+
+def _gemini_error(e) -> str:
+    msg = str(e)
+    if "quota" in msg.lower() or "429" in msg:
+        return "⚠️ Gemini API quota used up for today. Please try again tomorrow or upgrade your plan."
+    return f"❌ Gemini API Error: {e}"
+
+def call_deepseek(prompt: str) -> str:
+    try:
+        return get_client_manager().generate("DeepSeek", prompt)
     except Exception as e:
-        return f"❌ API Error: {e}"
+        return _provider_error("DeepSeek", e)
+
+def is_error_response(text: str) -> bool:
+    """Error / quota messages returned in place of an answer (never cached)."""
+    return not text or text.lstrip().startswith(("❌", "⚠️"))
+
+@st.cache_resource
+def get_ai_cache() -> AIResponseCache:
+    """Response cache; AI_CACHE_DIR / AI_CACHE_TTL / AI_CACHE_MAX_BYTES in secrets."""
+    return AIResponseCache(
+        st.secrets.get("AI_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "chinese_app_ai_cache"),
+        ttl=float(st.secrets.get("AI_CACHE_TTL", 7 * 86400)),
+        max_bytes=int(st.secrets.get("AI_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    )
+
+def ai_cache_enabled() -> bool:
+    """Off when AI_CACHE = "off" in secrets or the session ticked the bypass switch."""
+    if str(st.secrets.get("AI_CACHE", "on")).lower() in ("off", "false", "0"):
+        return False
+    return not st.session_state.get("ai_cache_bypass", False)
+
+def ai_cache_stats() -> dict:
+    try:
+        return get_ai_cache().stats()
+    except Exception:
+        return {}
+
+def _selected_provider(provider: str = None) -> tuple:
+    """(provider, model name) for `provider`, defaulting to the session's selection."""
+    provider = "Gemini" if (provider or st.session_state.get("selected_model")) == "Gemini" else "DeepSeek"
+    return provider, PROVIDER_MODELS[provider]
+
+def _routing() -> dict:
+    """
+    Failover (AI_FAILOVER, default on) and hedging delay (AI_HEDGE_AFTER seconds, default off).
+    Hedging only applies to non-streaming calls; stream_ai_model fails over but never hedges.
+    """
+    return {
+        "failover": str(st.secrets.get("AI_FAILOVER", "on")).lower() not in ("off", "false", "0"),
+        "hedge_after": float(st.secrets.get("AI_HEDGE_AFTER", 0)) or None,
+    }
+
+def _answered_by(provider: str):
+    st.session_state.ai_answered_by = provider
+
+def _stream_failed(failed: bool):
+    st.session_state.ai_stream_failed = failed
+
+def last_ai_failed() -> bool:
+    """Whether the last stream_ai_model call in this session ended in an error."""
+    return bool(st.session_state.get("ai_stream_failed"))
+
+def last_ai_provider() -> str:
+    """Provider that produced the last answer in this session (may differ after failover)."""
+    return st.session_state.get("ai_answered_by") or _selected_provider()[0]
+
+def ai_client_stats() -> dict:
+    try:
+        return get_client_manager().stats()
+    except Exception:
+        return {}
+
+def _complete(prompt: str, provider: str, model: str, cache, routing: dict) -> tuple:
+    """(text, provider that answered); touches no session state, so sessions can share it."""
+    if cache is not None:
+        cached = cache.get(provider, model, prompt)
+        if cached is not None:
+            return cached, provider
+    start = time.perf_counter()
+    try:
+        text, answered = get_client_manager().complete(prompt, provider, **routing)
+    except Exception as e:
+        return _provider_error(provider, e), provider
+    # an answer from the fallback provider is not stored under the selected one
+    if cache is not None and answered == provider and not is_error_response(text):
+        cache.put(provider, model, prompt, text, time.perf_counter() - start)
+    return text, answered
 
 def call_ai_model(prompt: str) -> str:
-    if st.session_state.get("selected_model") == "Gemini":
-        return call_gemini(prompt)
-    return call_deepseek(prompt)
+    provider, model = _selected_provider()
+    cache = get_ai_cache() if ai_cache_enabled() else None
+    routing = _routing()
+    # identical prompts already in flight (e.g. a whole class opening one lesson) share one call
+    try:
+        text, answered = get_singleflight().do(
+            "ai", (provider, cache is not None, prompt),
+            lambda: _complete(prompt, provider, model, cache, routing),
+        )
+    except Exception as e:
+        # the shared call was a stream that failed (an abandoned one is retried by do())
+        text, answered = _provider_error(provider, e), provider
+    _answered_by(answered)
+    return text
+
+def ai_singleflight_stats() -> dict:
+    """Calls and coalesced (shared) calls per kind ("ai", "tts")."""
+    return get_singleflight().stats()
+
+# ---------- streaming ----------
+# Chunks are yielded as the provider produces them (for st.write_stream); the joined
+# text goes through the same response cache as call_ai_model. A prompt that is already
+# being generated for another session is not sent again: it is shown once that finishes.
+# Streams are not hedged (AI_HEDGE_AFTER): two providers' chunks cannot be shown in one
+# output, so a stream only fails over to the other provider before its first chunk.
+
+def stream_ai_model(prompt: str):
+    """
+    Streaming call_ai_model: yields text chunks; errors arrive as a final chunk.
+    Check last_ai_failed() once the stream is consumed before keeping the text:
+    an error after partial output only shows up at the end of it.
+    """
+    provider, model = _selected_provider()
+    _stream_failed(False)
+    cache = get_ai_cache() if ai_cache_enabled() else None
+    if cache is not None:
+        cached = cache.get(provider, model, prompt)
+        if cached is not None:
+            _answered_by(provider)
+            yield cached
+            return
+    flights = get_singleflight()
+    key = (provider, cache is not None, prompt)
+    while True:
+        flight, leader = flights.acquire("ai", key)
+        if leader:
+            break
+        try:
+            text, answered = flights.wait(flight)
+        except FlightAbandoned:
+            continue  # the leading session was rerun mid-stream: generate it here instead
+        except Exception as e:
+            text, answered = _provider_error(provider, e), provider
+        _answered_by(answered)
+        _stream_failed(is_error_response(text))
+        yield text
+        return
+
+    result = failure = None
+    try:
+        manager = get_client_manager()
+        fallback = manager.fallback_for(provider) if _routing()["failover"] else None
+        start = time.perf_counter()
+        parts = []
+        answered = provider
+        try:
+            try:
+                for text in manager.stream(provider, prompt):
+                    parts.append(text)
+                    yield text
+            except Exception as e:
+                # fail over only if nothing has been shown yet
+                if parts or fallback is None or not should_failover(e):
+                    raise
+                answered = fallback
+                for text in manager.stream(fallback, prompt):
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            # waiting sessions get the error itself, not the truncated text
+            failure = e
+            _answered_by(answered)
+            _stream_failed(True)
+            yield ("\n\n" if parts else "") + _provider_error(answered, e)
+            return
+        _answered_by(answered)
+        text = "".join(parts)
+        result = (text, answered)
+        if cache is not None and answered == provider and not is_error_response(text):
+            cache.put(provider, model, prompt, text, time.perf_counter() - start)
+    finally:
+        # waiting sessions get the full text, the error, or FlightAbandoned (and then retry)
+        flights.release("ai", key, flight, result=result,
+                        error=failure or (None if result else FlightAbandoned("generation was interrupted")))
+
+# ---------- asyncio client API ----------
+# Independent prompts (e.g. typo check, keywords and dictionary for one passage) can be
+# sent together: wall-clock time is the slowest call instead of the sum of all of them.
+
+async def call_ai_model_async(prompt: str, provider: str = None) -> str:
+    """Async call_ai_model, sharing its response cache, single-flight, failover and hedging."""
+    provider, model = _selected_provider(provider)
+    cache = get_ai_cache() if ai_cache_enabled() else None
+    routing = _routing()
+    try:
+        # the pooled clients are blocking (and the shared GenerativeModel binds its async
+        # transport to the first event loop it sees), so calls run on worker threads;
+        # same flight key as call_ai_model / stream_ai_model, so chunk prompts coalesce too
+        text, _ = await asyncio.to_thread(
+            get_singleflight().do, "ai", (provider, cache is not None, prompt),
+            lambda: _complete(prompt, provider, model, cache, routing),
+        )
+    except Exception as e:
+        return _provider_error(provider, e)
+    return text
+
+async def gather_ai(prompts: list, limit: int = 4, provider: str = None) -> list:
+    """Answers for `prompts` in order, with at most `limit` requests in flight."""
+    provider = _selected_provider(provider)[0]
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def one(prompt):
+        async with semaphore:
+            return await call_ai_model_async(prompt, provider)
+
+    return await asyncio.gather(*(one(p) for p in prompts))
+
+def run_ai_batch(prompts: list, limit: int = 4) -> list:
+    """Blocking entry point for Streamlit code: run gather_ai on a fresh event loop."""
+    if not prompts:
+        return []
+    return asyncio.run(gather_ai(prompts, limit))
@@ -0,0 +1,139 @@
+# ai_cache.py
+# Disk-backed cache of AI responses, shared by every session in the process (and by
+# other processes pointing at the same directory).
+# - key: (provider, model name, prompt hash); one JSON file per entry
+# - entries older than `ttl` seconds are treated as misses and removed
+# - total size is kept under `max_bytes`, least recently used files are removed first
+#   (down to 90% of it); a running byte estimate decides when to prune, so the directory
+#   is only scanned when the estimate goes over budget or every `rescan_every` stores
+#   (other processes write to it too)
+# - error strings are never stored (see ai.is_error_response)
+# - hit / miss counters and the provider latency saved by hits
+
+import os, json, hashlib, threading, tempfile, time
+
+
+def response_key(provider: str, model: str, prompt: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (provider, model, prompt):
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AIResponseCache:
+    def __init__(self, disk_dir: str, ttl: float = 7 * 86400, max_bytes: int = 64 * 1024 * 1024,
+                 rescan_every: int = 200):
+        self.disk_dir = disk_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.rescan_every = rescan_every
+        self._bytes = None  # estimated size of the directory; None until the first scan
+        self._since_scan = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+        os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, provider: str, model: str, prompt: str):
+        """Cached response text or None."""
+        path = self._path(response_key(provider, model, prompt))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.ttl and time.time() - entry["created"] > self.ttl:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._add_bytes(-size)
+                entry = None
+            else:
+                os.utime(path)  # recently used entries are evicted last
+        except (OSError, ValueError, KeyError):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += float(entry.get("latency", 0.0))
+        return entry["text"]
+
+    def put(self, provider: str, model: str, prompt: str, text: str, latency: float = 0.0):
+        entry = {"provider": provider, "model": model, "created": time.time(),
+                 "latency": latency, "text": text}
+        path = self._path(response_key(provider, model, prompt))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(tmp)
+            try:
+                size -= os.path.getsize(path)  # replacing an expired / concurrent entry
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            with self._lock:
+                self.stores += 1
+                self._since_scan += 1
+                rescan = self._since_scan >= self.rescan_every
+            self._add_bytes(size)
+            if rescan or self._bytes is None or self._bytes > self.max_bytes:
+                self._prune()
+        except OSError:
+            pass
+
+    def _add_bytes(self, delta: int):
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += delta
+
+    def _prune(self):
+        """Scan the directory, reset the size estimate and evict down to max_bytes."""
+        with self._lock:
+            self._since_scan = 0
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            # evict to 90% of the budget, so the next stores do not trigger another scan
+            target = int(self.max_bytes * 0.9)
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        with self._lock:
+            self._bytes = total
+
+    def clear(self):
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
+        with self._lock:
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "saved_seconds": self.saved_seconds}
@@ -0,0 +1,198 @@
+# ai_clients.py
+# Long-lived provider clients shared by every session in the process.
+# - one Gemini model and one DeepSeek (OpenAI-compatible) client with a keep-alive
+#   connection pool, created on first use instead of per call
+# - complete(): optional hedged request (the other provider is also asked once the
+#   first has been silent for `hedge_after` seconds; the first good answer wins) and
+#   failover to the other provider on quota / rate-limit / 5xx / connection errors;
+#   stream() is never hedged (callers fail over only before the first chunk)
+# - returns the provider that actually answered, so exports record the right model
+# Nothing here touches Streamlit; ai.py builds the manager from secrets.
+
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+GEMINI_MODEL = "gemini-2.5-flash"
+DEEPSEEK_MODEL = "deepseek-chat"
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+PROVIDER_MODELS = {"Gemini": GEMINI_MODEL, "DeepSeek": DEEPSEEK_MODEL}
+FAILOVER_STATUS = {408, 429, 500, 502, 503, 504}
+_FAILOVER_WORDS = ("quota", "429", "rate limit", "resource exhausted", "unavailable",
+                   "timeout", "timed out", "connection", "overloaded")
+
+
+class ProviderUnavailable(Exception):
+    """The provider has no API key configured."""
+
+
+def should_failover(exc) -> bool:
+    """Errors another provider could do better on (quota, rate limit, 5xx, network)."""
+    if isinstance(exc, ProviderUnavailable):
+        return True
+    for attr in ("status_code", "code"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code in FAILOVER_STATUS
+    msg = str(exc).lower()
+    return any(w in msg for w in _FAILOVER_WORDS)
+
+def _deepseek_messages(prompt: str) -> list:
+    return [{"role":"system","content":"You are a helpful assistant."},
+            {"role":"user","content":prompt}]
+
+
+class AIClientManager:
+    def __init__(self, gemini_api_key: str = None, deepseek_api_key: str = None,
+                 deepseek_base_url: str = DEEPSEEK_BASE_URL, timeout: float = 120.0, max_workers: int = 8):
+        self.gemini_api_key = gemini_api_key
+        self.deepseek_api_key = deepseek_api_key
+        self.deepseek_base_url = deepseek_base_url
+        self.timeout = timeout
+        self._gemini = None
+        self._deepseek = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-client")
+        self._stats = {"failovers": 0, "hedges": 0, "hedge_wins": 0}
+        self._per_provider = {p: {"calls": 0, "errors": 0, "total_seconds": 0.0} for p in PROVIDER_MODELS}
+
+    # ---------- clients ----------
+    def configured(self, provider: str) -> bool:
+        return bool(self.gemini_api_key if provider == "Gemini" else self.deepseek_api_key)
+
+    def gemini(self):
+        if not self.gemini_api_key:
+            raise ProviderUnavailable("Gemini API key not configured. Please set GEMINI_API_KEY in secrets.")
+        with self._lock:
+            if self._gemini is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.gemini_api_key)
+                self._gemini = genai.GenerativeModel(GEMINI_MODEL)
+            return self._gemini
+
+    def deepseek(self):
+        if not self.deepseek_api_key:
+            raise ProviderUnavailable("DeepSeek API key not configured. Please set DEEPSEEK_API_KEY in secrets.")
+        with self._lock:
+            if self._deepseek is None:
+                from openai import OpenAI
+                # retries are handled here (failover), not inside the SDK
+                self._deepseek = OpenAI(api_key=self.deepseek_api_key, base_url=self.deepseek_base_url,
+                                        timeout=self.timeout, max_retries=0)
+            return self._deepseek
+
+    # ---------- calls ----------
+    def _record(self, provider: str, seconds: float, error: bool = False):
+        with self._lock:
+            s = self._per_provider[provider]
+            s["calls"] += 1
+            s["errors"] += int(error)
+            s["total_seconds"] += seconds
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def generate(self, provider: str, prompt: str) -> str:
+        """One blocking completion from `provider`; raises on any error."""
+        start = time.perf_counter()
+        try:
+            if provider == "Gemini":
+                text = self.gemini().generate_content(prompt).text
+            else:
+                resp = self.deepseek().chat.completions.create(
+                    model=DEEPSEEK_MODEL, messages=_deepseek_messages(prompt), stream=False
+                )
+                text = resp.choices[0].message.content
+        except Exception:
+            self._record(provider, time.perf_counter() - start, error=True)
+            raise
+        self._record(provider, time.perf_counter() - start)
+        return text
+
+    def stream(self, provider: str, prompt: str):
+        """Yield text chunks from `provider`; raises on any error."""
+        start = time.perf_counter()
+        error = False
+        try:
+            if provider == "Gemini":
+                for chunk in self.gemini().generate_content(prompt, stream=True):
+                    try:
+                        text = chunk.text
+                    except ValueError:  # chunk without text parts (e.g. safety metadata)
+                        continue
+                    if text:
+                        yield text
+            else:
+                stream = self.deepseek().chat.completions.create(
+                    model=DEEPSEEK_MODEL, messages=_deepseek_messages(prompt), stream=True
+                )
+                for chunk in stream:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        yield text
+        except Exception:
+            error = True
+            raise
+        finally:
+            # a stream abandoned by its reader still counts, as a call that did not fail
+            self._record(provider, time.perf_counter() - start, error=error)
+
+    def fallback_for(self, provider: str):
+        other = "DeepSeek" if provider == "Gemini" else "Gemini"
+        return other if self.configured(other) else None
+
+    def complete(self, prompt: str, provider: str, hedge_after: float = None, failover: bool = True):
+        """
+        (text, provider that answered). With `hedge_after` the fallback provider is asked
+        too if the first one has not answered in time; otherwise it is only asked when
+        the first fails with a failover-worthy error. Raises the first error if nobody answers.
+        """
+        other = self.fallback_for(provider) if failover else None
+        if not hedge_after or other is None:
+            try:
+                return self.generate(provider, prompt), provider
+            except Exception as e:
+                if other is None or not should_failover(e):
+                    raise
+                self._count("failovers")
+                try:
+                    return self.generate(other, prompt), other
+                except Exception:
+                    raise e
+
+        futures = {self._pool.submit(self.generate, provider, prompt): provider}
+        done, _ = wait(futures, timeout=hedge_after)
+        hedged = not done
+        if hedged:
+            self._count("hedges")
+            futures[self._pool.submit(self.generate, other, prompt)] = other
+        first_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    text = f.result()
+                except Exception as e:
+                    if futures[f] == provider:
+                        first_error = e
+                        # the primary failed before the hedge fired: fail over now
+                        if not hedged and should_failover(e):
+                            self._count("failovers")
+                            g = self._pool.submit(self.generate, other, prompt)
+                            futures[g] = other
+                            pending.add(g)
+                    first_error = first_error or e
+                    continue
+                if hedged and futures[f] != provider:
+                    self._count("hedge_wins")
+                for p in pending:
+                    p.cancel()  # a request already running is left to finish in the pool
+                return text, futures[f]
+        raise first_error
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = {p: dict(s, avg_seconds=s["total_seconds"] / s["calls"] if s["calls"] else 0.0)
+                         for p, s in self._per_provider.items()}
+            return dict(self._stats, providers=providers)
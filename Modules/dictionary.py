@@ -0,0 +1,123 @@
+# dictionary.py
+# Per-word dictionary entries for the tab 2 "字典" button.
+# - each word's row (繁體 / 簡體 / 拼音 / 解釋 / 例句 / 例句) is stored on its own,
+#   keyed by (normalized Traditional word, model), in a small SQLite file
+# - only words without a stored row are sent to the model; the markdown table is then
+#   assembled from stored rows in the order the words were entered
+# - only complete rows (all six cells) from an answer without errors are stored; words
+#   the answer has no row for are reported as missing (never put in the table, which is
+#   saved and exported) and asked again next time
+# Set DICTIONARY_PATH in secrets to choose the database file.
+
+import json, sqlite3, threading, time
+from Modules.text_utils import normalize_traditional, split_keywords
+from Modules.ai import is_error_response
+
+HEADERS = ["繁體", "簡體", "拼音", "解釋", "例句", "例句"]
+
+
+def dictionary_prompt(words: list) -> str:
+    return f"""
+            You are a Chinese native speaker, being a language tutor for kids 8-10 years old.
+
+            Please explain the words in "{', '.join(words)}" in Traditional Chinese using Markdown table format with the following columns:
+
+            Column 1: Heading = "繁體", content = the original character in traditional chinese
+            Column 2: Heading = "簡體", content = convert the column 1 characters into simplified chinese
+            Column 3: Heading = "拼音", content = Mandarin pinyin
+            Column 4: Heading = "解釋", content = A beginner-friendly, simple definition
+            Column 5 & 6: Heading = "例句", content = An example sentence, show in both traditional (column 5) and simplified chinese
+
+            Respond only in Traditional Chinese. Format your response as a Markdown table, one row per word.
+            """
+
+def word_key(word: str) -> str:
+    return normalize_traditional(word.strip())
+
+def parse_dictionary_rows(response_text: str) -> dict:
+    """word_key -> list of cells for every data row of a markdown table."""
+    rows = {}
+    for line in (response_text or "").splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            continue
+        cells = [c.strip() for c in line.strip("|").split("|")]
+        cells[0] = cells[0].strip("*_` ")  # models sometimes bold the headword
+        if not cells[0] or cells[0] == HEADERS[0] or set(cells[0]) <= set("-: "):
+            continue
+        cells = (cells + [""] * len(HEADERS))[:len(HEADERS)]
+        rows.setdefault(word_key(cells[0]), cells)
+    return rows
+
+def is_complete(cells: list) -> bool:
+    return len(cells) == len(HEADERS) and all(cells)
+
+def build_table(rows: list) -> str:
+    lines = ["| " + " | ".join(HEADERS) + " |", "|" + "---|" * len(HEADERS)]
+    lines += ["| " + " | ".join(cells) + " |" for cells in rows]
+    return "\n".join(lines)
+
+
+class DictionaryStore:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self.hits = 0
+        self.misses = 0
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    word TEXT NOT NULL, model TEXT NOT NULL, cells TEXT NOT NULL, created REAL,
+                    PRIMARY KEY (word, model)
+                )
+            """)
+
+    def get_many(self, keys: list, model: str) -> dict:
+        if not keys:
+            return {}
+        with self._lock:
+            found = {
+                word: json.loads(cells) for word, cells in self._conn.execute(
+                    f"SELECT word, cells FROM entries WHERE model = ? AND word IN ({', '.join('?' * len(keys))})",
+                    [model] + list(keys),
+                )
+            }
+            self.hits += len(found)
+            self.misses += len(set(keys) - set(found))
+        return found
+
+    def put_many(self, rows: dict, model: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (word, model, cells, created) VALUES (?, ?, ?, ?)",
+                [(word, model, json.dumps(cells, ensure_ascii=False), now) for word, cells in rows.items()],
+            )
+
+    def lookup(self, words_string: str, model: str, ask):
+        """
+        (markdown table, error, model that wrote the new rows, words without a row) for the
+        comma-separated words.
+        `ask(prompt)` returns (answer, model that answered, whether the call failed) and is
+        called once, only for the words that have no stored row; an error answer is returned
+        as-is and nothing is stored. Rows from a failover model are stored under that model.
+        Incomplete rows are shown but not stored. Words the answer has no row for are left out
+        of the table and returned separately, so callers can say the table is incomplete.
+        """
+        words = list(dict.fromkeys(word_key(w) for w in split_keywords(words_string)))
+        stored = self.get_many(words, model)
+        missing = [w for w in words if w not in stored]
+        if missing:
+            response, model, failed = ask(dictionary_prompt(missing))
+            if failed or is_error_response(response):
+                return "", response, model, missing
+            fetched = {w: cells for w, cells in parse_dictionary_rows(response).items() if w in missing}
+            self.put_many({w: cells for w, cells in fetched.items() if is_complete(cells)}, model)
+            stored.update(fetched)
+        return build_table([stored[w] for w in words if w in stored]), None, model, \
+            [w for w in words if w not in stored]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {"entries": total, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,141 @@
+# facets.py
+# Inverted facet index for the revision tab filters.
+# - one bitset (a Python int, bit i = record i) per value of each facet key
+# - available options and matching records come from bitset intersections,
+#   so filter changes cost O(values) big-int ops instead of rescanning every record
+# - sort orders and a sorted title table are precomputed once per snapshot, so the
+#   record picker can page and prefix-search without touching the whole archive
+# - indexes are cached per record snapshot (fingerprint of record ids + export dates)
+
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from Modules.text_utils import canon_title_for_compare
+
+ALL = "所有"
+SORT_KEYS = ("export_date", "page_number")
+SEARCH_KEYS = ("book_title", "article_title")
+
+
+def _iter_bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class FacetIndex:
+    def __init__(self, records: list, keys):
+        self.records = records
+        self.keys = list(keys)
+        self.all_mask = (1 << len(records)) - 1
+        self.postings = {k: {} for k in self.keys}
+        for i, r in enumerate(records):
+            bit = 1 << i
+            for k in self.keys:
+                v = str(r.get(k, "") or "")
+                self.postings[k][v] = self.postings[k].get(v, 0) | bit
+        self._orders = {}
+        self._titles = None
+        self.search_mask = lru_cache(maxsize=128)(self._search_mask)
+
+    def mask_for(self, filters: dict, exclude_key: str = None) -> int:
+        """Bitset of records matching every filter except `exclude_key` ("所有" = no filter)."""
+        mask = self.all_mask
+        for k, v in filters.items():
+            if k == exclude_key or v == ALL or k not in self.postings:
+                continue
+            mask &= self.postings[k].get(v, 0)
+            if not mask:
+                break
+        return mask
+
+    def options(self, key: str, filters: dict) -> list:
+        """Non-empty values of `key` still reachable under the other filters."""
+        mask = self.mask_for(filters, exclude_key=key)
+        return [v for v, bits in self.postings[key].items() if v and bits & mask]
+
+    def count(self, filters: dict) -> int:
+        return self.mask_for(filters).bit_count()
+
+    def matching(self, filters: dict) -> list:
+        return [self.records[i] for i in _iter_bits(self.mask_for(filters))]
+
+    # ---------- record picker ----------
+    def order(self, sort_key: str) -> list:
+        """Record positions sorted by export date (newest first) or page number."""
+        if sort_key not in self._orders:
+            if sort_key == "page_number":
+                def page_key(i):
+                    p = str(self.records[i].get("page_number", "") or "")
+                    return (0, int(p), "") if p.isdigit() else (1, 0, p)
+                self._orders[sort_key] = sorted(range(len(self.records)), key=page_key)
+            else:
+                self._orders[sort_key] = sorted(
+                    range(len(self.records)),
+                    key=lambda i: str(self.records[i].get(sort_key, "") or ""), reverse=True,
+                )
+        return self._orders[sort_key]
+
+    def _search_mask(self, prefix: str) -> int:
+        """Records whose book or article title starts with `prefix` (either script)."""
+        if self._titles is None:
+            self._titles = sorted(
+                (canon_title_for_compare(str(r.get(k, "") or "")), i)
+                for i, r in enumerate(self.records) for k in SEARCH_KEYS
+            )
+        key = canon_title_for_compare(prefix)
+        mask = 0
+        for title, i in self._titles[bisect_left(self._titles, (key, -1)):]:
+            if not title.startswith(key):
+                break
+            mask |= 1 << i
+        return mask
+
+    def picker_mask(self, filters: dict, prefix: str = "") -> int:
+        mask = self.mask_for(filters)
+        if prefix and prefix.strip():
+            mask &= self.search_mask(prefix.strip())
+        return mask
+
+    def total(self, filters: dict, prefix: str = "") -> int:
+        return self.picker_mask(filters, prefix).bit_count()
+
+    def page(self, filters: dict, prefix: str = "", sort_key: str = "export_date",
+             page: int = 1, page_size: int = 20):
+        """(records on this page, total matches) without building labels for the rest."""
+        mask = self.picker_mask(filters, prefix)
+        total = mask.bit_count()
+        if page_size <= 0:
+            return [], total
+        start = (max(page, 1) - 1) * page_size
+        order = self.order(sort_key if sort_key in SORT_KEYS else "export_date")
+        if mask == self.all_mask:
+            picked = order[start:start + page_size]
+        else:
+            wanted = set(_iter_bits(mask))
+            picked, seen = [], 0
+            for i in order:
+                if i in wanted:
+                    if seen >= start:
+                        picked.append(i)
+                        if len(picked) == page_size:
+                            break
+                    seen += 1
+        return [self.records[i] for i in picked], total
+
+
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+def facet_index_for(records: list, keys) -> FacetIndex:
+    """FacetIndex for this snapshot, reused across reruns and sessions until the records change."""
+    fingerprint = (tuple(keys), hash(tuple((r.get("record_id"), r.get("export_date")) for r in records)), len(records))
+    with _CACHE_LOCK:
+        cached = _CACHE.get("index")
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+    index = FacetIndex(records, keys)
+    with _CACHE_LOCK:
+        _CACHE["index"] = (fingerprint, index)
+    return index
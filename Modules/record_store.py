@@ -0,0 +1,302 @@
+# record_store.py
+# Pluggable storage for exported lessons.
+# - RecordStore: load / exists / upsert / query, used by tabs 2 and 4
+#   plus load_metadata / get_body: tab 4 lists and filters on the small metadata
+#   projection and fetches the large body columns only for the selected record
+# - SheetsRecordStore: the existing Google Sheets path (sheets.py)
+# - SQLiteRecordStore: embedded database for local runs, offline classrooms and load tests
+# Pick the backend with RECORD_STORE = "sheets" | "sqlite" in secrets (default: sheets);
+# SQLITE_PATH sets the database file for the sqlite backend.
+# Spaced-repetition review state is stored next to the records (a "reviews" worksheet
+# or table) and served from an in-process due heap (srs.DueQueue).
+
+import sqlite3, threading, time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import streamlit as st
+from Modules.sheets import (
+    load_records, check_record_exists, save_to_gs, clear_gs_caches,
+    write_queue_status, record_key, get_hong_kong_time,
+    META_COLUMNS, load_record_metadata, load_record_body,
+    load_review_states, load_review_state, save_review_state,
+)
+from Modules.write_queue import COLUMNS
+from Modules.search import BigramIndex
+from Modules.srs import REVIEW_COLUMNS, DueQueue, review_key, schedule
+
+BODY_COLUMNS = [c for c in COLUMNS if c not in META_COLUMNS]
+
+
+class RecordStore(ABC):
+    name = ""
+    body_cache_size = 32
+    review_ttl = 60  # seconds before review states are re-read (other processes review too)
+
+    def __init__(self):
+        self._body_cache = OrderedDict()  # (record_id, export_date) -> body dict
+        self._body_lock = threading.Lock()
+        self._search_index = BigramIndex()
+        self._search_lock = threading.Lock()
+        self._reviews = None  # (states, DueQueue, loaded_at), loaded on first use
+        self._review_lock = threading.Lock()
+
+    @abstractmethod
+    def load(self) -> list:
+        """Every record as a dict keyed by COLUMNS."""
+
+    @abstractmethod
+    def exists(self, book_title: str, article_title: str, model_used: str) -> bool:
+        """Whether a record with the same canonical (book, article, model) key exists."""
+
+    @abstractmethod
+    def upsert(self, text_data, keywords, dictionary_data, model_used,
+               book_title="", article_title="", page_number="") -> int:
+        """Create or overwrite a record; returns the record count (0 on failure)."""
+
+    def query(self, **filters) -> list:
+        """Records whose columns equal every given filter value."""
+        return [r for r in self.load()
+                if all(str(r.get(k, "")) == str(v) for k, v in filters.items())]
+
+    def load_metadata(self) -> list:
+        """META_COLUMNS plus a backend-specific `record_id` for every record."""
+        return [{**{c: r.get(c, "") for c in META_COLUMNS}, "record_id": i}
+                for i, r in enumerate(self.load())]
+
+    def _fetch_body(self, record_id) -> dict:
+        record = self.load()[record_id]
+        return {c: record.get(c, "") for c in BODY_COLUMNS}
+
+    def get_body(self, record_id, export_date: str = "") -> dict:
+        """
+        Body columns of one record, cached per record.
+        export_date is part of the key, so an overwritten record is fetched again.
+        """
+        key = (record_id, export_date)
+        with self._body_lock:
+            if key in self._body_cache:
+                self._body_cache.move_to_end(key)
+                return self._body_cache[key]
+        body = self._fetch_body(record_id)
+        with self._body_lock:
+            self._body_cache[key] = body
+            while len(self._body_cache) > self.body_cache_size:
+                self._body_cache.popitem(last=False)
+        return body
+
+    def search(self, query: str, limit: int = 50) -> list:
+        """
+        Full-text search over text, keywords and dictionary entries.
+        Returns metadata dicts (best first) with a `score`; the index picks up new or
+        re-exported records on the next call.
+        """
+        metas = self.load_metadata()
+        with self._search_lock:
+            self._search_index.sync(metas, self._fetch_body)
+        by_id = {m["record_id"]: m for m in metas}
+        return [dict(by_id[d], score=score)
+                for d, score in self._search_index.search(query, limit) if d in by_id]
+
+    # ---------- spaced repetition ----------
+    def load_review_states(self) -> dict:
+        """review_key -> state for every record that has been reviewed; raises if unreadable."""
+        return {}
+
+    def load_review_state(self, key: str):
+        """Current stored state of one record (None if never reviewed); raises if unreadable."""
+        return self.load_review_states().get(key)
+
+    def _save_review_state(self, key: str, state: dict) -> bool:
+        return False
+
+    def _review_data(self):
+        """(states, DueQueue), re-read every review_ttl seconds; a failed read is not kept."""
+        with self._review_lock:
+            if self._reviews is None or time.monotonic() - self._reviews[2] > self.review_ttl:
+                states = self.load_review_states()
+                self._reviews = (states, DueQueue(states), time.monotonic())
+            return self._reviews[:2]
+
+    def review_state(self, record: dict):
+        return self._review_data()[0].get(review_key(record))
+
+    def record_review(self, record: dict, grade: str) -> dict:
+        """
+        Schedule the next review of `record`; the due heap is updated in place.
+        The stored state is re-read first, so a review made by another process is built on.
+        Returns None (nothing changed) if the state could not be saved.
+        """
+        states, queue = self._review_data()
+        key = review_key(record)
+        state = schedule(self.load_review_state(key), grade)
+        if not self._save_review_state(key, state):
+            return None
+        with self._review_lock:
+            states[key] = state
+        queue.update(key, state["due"])
+        return state
+
+    def due_records(self, metadata: list, now: float = None, limit: int = 50) -> list:
+        """Metadata of the records due for review, most overdue first."""
+        keys = self._review_data()[1].due(now, limit)
+        if not keys:
+            return []
+        by_key = {review_key(m): m for m in metadata}
+        return [by_key[k] for k in keys if k in by_key]
+
+    def next_review_due(self):
+        return self._review_data()[1].next_due()
+
+    def clear_cache(self):
+        with self._body_lock:
+            self._body_cache.clear()
+        with self._review_lock:
+            self._reviews = None
+
+    def status(self) -> dict:
+        return {}
+
+
+class SheetsRecordStore(RecordStore):
+    name = "Google Sheet"
+
+    def load(self) -> list:
+        return load_records()
+
+    def exists(self, book_title, article_title, model_used) -> bool:
+        return check_record_exists(book_title, article_title, model_used)
+
+    def upsert(self, text_data, keywords, dictionary_data, model_used,
+               book_title="", article_title="", page_number="") -> int:
+        return save_to_gs(text_data, keywords, dictionary_data, model_used,
+                          book_title, article_title, page_number)
+
+    def load_metadata(self) -> list:
+        return load_record_metadata()
+
+    def _fetch_body(self, record_id) -> dict:
+        record = load_record_body(record_id)
+        return {c: record.get(c, "") for c in BODY_COLUMNS}
+
+    def load_review_states(self) -> dict:
+        return load_review_states()
+
+    def load_review_state(self, key: str):
+        return load_review_state(key)
+
+    def _save_review_state(self, key, state) -> bool:
+        return save_review_state(key, state)
+
+    def clear_cache(self):
+        super().clear_cache()
+        clear_gs_caches()
+
+    def status(self) -> dict:
+        return write_queue_status()
+
+
+class SQLiteRecordStore(RecordStore):
+    name = "SQLite"
+
+    def __init__(self, path: str = "chinese_learning_records.db"):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    export_date TEXT, book_title TEXT, article_title TEXT, page_number TEXT,
+                    original_text_trad TEXT, keywords TEXT, dictionary_data TEXT, model_used TEXT,
+                    book_key TEXT NOT NULL, article_key TEXT NOT NULL, model_key TEXT NOT NULL,
+                    UNIQUE (book_key, article_key, model_key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_records_book_title ON records (book_title);
+                CREATE INDEX IF NOT EXISTS idx_records_article_title ON records (article_title);
+                CREATE INDEX IF NOT EXISTS idx_records_model_used ON records (model_used);
+                CREATE TABLE IF NOT EXISTS reviews (
+                    review_key TEXT PRIMARY KEY, due REAL, interval REAL, ease REAL,
+                    reps INTEGER, lapses INTEGER, last_review REAL
+                );
+            """)
+
+    def _rows(self, sql: str, params=()) -> list:
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+
+    def load(self) -> list:
+        return self._rows(f"SELECT {', '.join(COLUMNS)} FROM records ORDER BY id")
+
+    def exists(self, book_title, article_title, model_used) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM records WHERE book_key = ? AND article_key = ? AND model_key = ?",
+                record_key(book_title, article_title, model_used),
+            ).fetchone() is not None
+
+    def upsert(self, text_data, keywords, dictionary_data, model_used,
+               book_title="", article_title="", page_number="") -> int:
+        values = (
+            get_hong_kong_time().strftime("%Y-%m-%d %H:%M:%S"),
+            book_title.strip(), article_title.strip(), str(page_number).strip(),
+            text_data, keywords, dictionary_data, model_used.strip(),
+        ) + record_key(book_title, article_title, model_used)
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(f"""
+                    INSERT INTO records ({', '.join(COLUMNS)}, book_key, article_key, model_key)
+                    VALUES ({', '.join('?' * (len(COLUMNS) + 3))})
+                    ON CONFLICT (book_key, article_key, model_key) DO UPDATE SET
+                    {', '.join(f'{c} = excluded.{c}' for c in COLUMNS)}
+                """, values)
+                return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        except sqlite3.Error as e:
+            st.error(f"Error saving to SQLite: {e}")
+            return 0
+
+    def load_metadata(self) -> list:
+        return self._rows(f"SELECT id AS record_id, {', '.join(META_COLUMNS)} FROM records ORDER BY id")
+
+    def _fetch_body(self, record_id) -> dict:
+        rows = self._rows(f"SELECT {', '.join(BODY_COLUMNS)} FROM records WHERE id = ?", (record_id,))
+        return rows[0] if rows else {c: "" for c in BODY_COLUMNS}
+
+    def load_review_states(self) -> dict:
+        return {r.pop("review_key"): r for r in self._rows(f"SELECT {', '.join(REVIEW_COLUMNS)} FROM reviews")}
+
+    def load_review_state(self, key: str):
+        rows = self._rows(f"SELECT {', '.join(REVIEW_COLUMNS[1:])} FROM reviews WHERE review_key = ?", [key])
+        return rows[0] if rows else None
+
+    def _save_review_state(self, key, state) -> bool:
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(f"""
+                    INSERT OR REPLACE INTO reviews ({', '.join(REVIEW_COLUMNS)})
+                    VALUES ({', '.join('?' * len(REVIEW_COLUMNS))})
+                """, [key] + [state[c] for c in REVIEW_COLUMNS[1:]])
+            return True
+        except sqlite3.Error as e:
+            st.error(f"Error saving review schedule: {e}")
+            return False
+
+    def query(self, **filters) -> list:
+        # like the base class, an unknown column reads as "": it only matches an empty value
+        if any(str(v) != "" for k, v in filters.items() if k not in COLUMNS):
+            return []
+        cols = [k for k in filters if k in COLUMNS]
+        where = " AND ".join(f"{c} = ?" for c in cols) or "1"
+        return self._rows(
+            f"SELECT {', '.join(COLUMNS)} FROM records WHERE {where} ORDER BY id",
+            [str(filters[c]) for c in cols],
+        )
+
+
+@st.cache_resource
+def get_record_store() -> RecordStore:
+    backend = str(st.secrets.get("RECORD_STORE", "sheets")).lower()
+    if backend == "sqlite":
+        return SQLiteRecordStore(st.secrets.get("SQLITE_PATH", "chinese_learning_records.db"))
+    return SheetsRecordStore()
@@ -0,0 +1,109 @@
+# render_cache.py
+# Cache of rendered lesson views for the revision tab.
+# Archived records never change after export, so the normalized + highlighted
+# Traditional / Simplified paragraphs are stored per content hash of (text, keywords).
+# - in-memory LRU shared by every session in the process
+# - optional on-disk layer (one JSON file per entry, oldest files pruned first)
+
+import os, json, hashlib, threading, tempfile
+from collections import OrderedDict
+from Modules.text_utils import normalize_stream, highlight_words_dual
+
+
+def render_key(text: str, keywords: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update((text or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update((keywords or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = 64, disk_dir: str = None, max_disk_entries: int = 2000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> [(trad_html, simp_html), ...]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _remember(self, key: str, paragraphs: list):
+        with self._lock:
+            self._entries[key] = paragraphs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                paragraphs = [tuple(p) for p in json.load(f)]
+            os.utime(path)  # keep recently used files from being pruned
+            return paragraphs
+        except (OSError, ValueError):
+            return None
+
+    def _save_disk(self, key: str, paragraphs: list):
+        if not self.disk_dir:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(paragraphs, f, ensure_ascii=False)
+            os.replace(tmp, self._disk_path(key))
+            files = [os.path.join(self.disk_dir, n) for n in os.listdir(self.disk_dir) if n.endswith(".json")]
+            if len(files) > self.max_disk_entries:
+                files.sort(key=os.path.getmtime)
+                for path in files[:len(files) - self.max_disk_entries]:
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, text: str, keywords: str):
+        """Cached paragraphs or None."""
+        key = render_key(text, keywords)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        paragraphs = self._load_disk(key)
+        if paragraphs is not None:
+            self.disk_hits += 1
+            self._remember(key, paragraphs)
+        return paragraphs
+
+    def paragraphs(self, text: str, keywords: str):
+        """
+        Yield highlighted (traditional, simplified) paragraphs; a miss renders them
+        progressively and stores the result once the whole lesson has been produced.
+        """
+        cached = self.get(text, keywords)
+        if cached is not None:
+            yield from cached
+            return
+        with self._lock:
+            self.misses += 1
+        rendered = []
+        for para_trad, para_simp in normalize_stream(text):
+            pair = highlight_words_dual(para_trad, para_simp, keywords)
+            rendered.append(pair)
+            yield pair
+        key = render_key(text, keywords)
+        self._remember(key, rendered)
+        self._save_disk(key, rendered)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
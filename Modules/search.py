@@ -0,0 +1,108 @@
+# search.py
+# Full-text search over archived lessons.
+# - character-bigram inverted index (plus single characters, for one-character queries)
+#   over original_text_trad, keywords and dictionary_data
+# - text and queries are both normalized to Traditional, so either script matches
+# - documents are keyed by record_id and re-indexed only when their export_date changes
+# - ranking: field-weighted tf-idf over the query terms; every term must match
+
+import math, re, threading
+from Modules.text_utils import normalize_traditional
+
+FIELD_WEIGHTS = {"keywords": 3.0, "original_text_trad": 1.0, "dictionary_data": 1.0}
+_CJK = re.compile(r"[㐀-鿿豈-﫿\U00020000-\U0002ffff]+")
+_WORD = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text: str) -> list:
+    """Normalized unigrams + bigrams for CJK runs, lowercase words for everything else."""
+    trad = normalize_traditional(text).lower()
+    terms = []
+    for run in _CJK.findall(trad):
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(_WORD.findall(trad))
+    return terms
+
+def query_terms(query: str) -> list:
+    """Bigrams where possible (single characters only for one-character runs)."""
+    trad = normalize_traditional(query).lower()
+    terms = []
+    for run in _CJK.findall(trad):
+        terms.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+    terms.extend(_WORD.findall(trad))
+    return list(dict.fromkeys(terms))
+
+
+class BigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}   # term -> {doc_id: weighted tf}
+        self._doc_terms = {}  # doc_id -> set of terms (for removal)
+        self._versions = {}   # doc_id -> export_date at indexing time
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id, record: dict, version: str = ""):
+        weights = {}
+        for field, w in FIELD_WEIGHTS.items():
+            for term in tokenize(str(record.get(field, "") or "")):
+                weights[term] = weights.get(term, 0.0) + w
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in weights.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            self._doc_terms[doc_id] = set(weights)
+            self._versions[doc_id] = version
+
+    def _remove(self, doc_id):
+        for term in self._doc_terms.pop(doc_id, ()):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+        self._versions.pop(doc_id, None)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def sync(self, metadata: list, fetch_body):
+        """
+        Bring the index in line with the current metadata: (re)index records that are
+        new or whose export_date changed, drop ones that disappeared.
+        Returns the number of documents (re)indexed.
+        """
+        current = {m["record_id"]: str(m.get("export_date", "")) for m in metadata}
+        stale = [d for d, v in current.items() if self._versions.get(d) != v]
+        with self._lock:
+            for d in [d for d in self._versions if d not in current]:
+                self._remove(d)
+        for d in stale:
+            self.add(d, fetch_body(d), current[d])
+        return len(stale)
+
+    def search(self, query: str, limit: int = 50) -> list:
+        """[(doc_id, score)] best first; every query term has to occur in the document."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            postings = [self._postings.get(t) for t in terms]
+            if not all(postings):
+                return []
+            n_docs = len(self._doc_terms)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for p in postings[1:]:
+                candidates.intersection_update(p)
+                if not candidates:
+                    return []
+            scores = dict.fromkeys(candidates, 0.0)
+            for p in postings:
+                idf = math.log(1 + n_docs / len(p))
+                for d in candidates:
+                    scores[d] += (1 + math.log(p[d])) * idf
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
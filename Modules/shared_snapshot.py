@@ -0,0 +1,153 @@
+# shared_snapshot.py
+# On-disk snapshot of the record set shared by every Streamlit worker process on a host.
+# - written to a temp file and os.replace()d, so readers never see a partial file
+# - readers mmap the file and decode single records on demand; nothing is copied up front
+# - each record is stored as two JSON blobs (metadata, full record) so listing pages
+#   never decode the large body columns
+# - an flock on a side file makes sure only one process refreshes from the source;
+#   the others keep serving the current snapshot meanwhile
+#
+# Layout: header | offset table (count x 4 u64) | blobs
+#   header = magic, version (u64, +1 per write), created_at (f64), count (u32), pad (u32)
+
+import os, json, mmap, struct, threading, time, tempfile
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: no cross-process lock, every process may refresh
+    fcntl = None
+
+MAGIC = b"CLSNAP1\0"
+HEADER = struct.Struct("<8sQdII")
+ENTRY = struct.Struct("<QQQQ")  # meta offset, meta length, record offset, record length
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class SnapshotView:
+    """Read-only, memory-mapped view of one snapshot version."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.created_at, self.count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a record snapshot")
+
+    def same_file(self, stat) -> bool:
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == \
+               (self._stat.st_ino, self._stat.st_mtime_ns, self._stat.st_size)
+
+    def _entry(self, i: int):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return ENTRY.unpack_from(self._mm, HEADER.size + i * ENTRY.size)
+
+    def meta(self, i: int) -> dict:
+        off, length, _, _ = self._entry(i)
+        return json.loads(self._mm[off:off + length])
+
+    def record(self, i: int) -> dict:
+        _, _, off, length = self._entry(i)
+        return json.loads(self._mm[off:off + length])
+
+    def records(self) -> list:
+        return [self.record(i) for i in range(self.count)]
+
+    def metadata(self) -> list:
+        return [self.meta(i) for i in range(self.count)]
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class SharedSnapshot:
+    def __init__(self, path: str, meta_columns):
+        self.path = path
+        self.meta_columns = list(meta_columns)
+        self._lock_path = path + ".lock"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._view = None
+        self._local = threading.Lock()
+        self.refreshes = 0
+        self.last_refresh_seconds = 0.0
+
+    # ---------- reading ----------
+    def read(self):
+        """Current snapshot view (re-mapped only if another process replaced the file), or None."""
+        with self._local:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return None
+            if self._view is None or not self._view.same_file(stat):
+                try:
+                    self._view = SnapshotView(self.path)
+                except (OSError, ValueError, struct.error):
+                    return None
+            return self._view
+
+    # ---------- writing ----------
+    def write(self, records: list, created_at: float = None) -> int:
+        """Atomically replace the snapshot; returns the new version."""
+        current = self.read()
+        version = (current.version if current else 0) + 1
+        metas = [_dumps({c: r.get(c, "") for c in self.meta_columns}) for r in records]
+        fulls = [_dumps(r) for r in records]
+        offset = HEADER.size + ENTRY.size * len(records)
+        table = bytearray()
+        for m, full in zip(metas, fulls):
+            table += ENTRY.pack(offset, len(m), offset + len(m), len(full))
+            offset += len(m) + len(full)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, version, created_at or time.time(), len(records), 0))
+                f.write(table)
+                for m, full in zip(metas, fulls):
+                    f.write(m)
+                    f.write(full)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return version
+
+    def refresh_if_stale(self, fetch, max_age: float, force: bool = False):
+        """
+        Return a fresh-enough view. If the snapshot is missing or older than max_age,
+        the process that wins the lock calls fetch() and rewrites it; the others return
+        the current view without waiting (or wait only when there is nothing to read yet).
+        """
+        view = self.read()
+        if view is not None and not force and time.time() - view.created_at < max_age:
+            return view
+        with open(self._lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (fcntl.LOCK_NB if view is not None else 0))
+                except BlockingIOError:
+                    return view  # someone else is refreshing; serve the current snapshot
+            try:
+                # another process may have finished a refresh while we waited for the lock
+                latest = self.read()
+                if latest is not None and latest is not view and time.time() - latest.created_at < max_age:
+                    return latest
+                started = time.time()
+                records = fetch()
+                self.write(records, created_at=started)
+                self.refreshes += 1
+                self.last_refresh_seconds = time.time() - started
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return self.read()
@@ -0,0 +1,117 @@
+# sheet_sync.py
+# Incremental mirror of the records worksheet.
+# - every export rewrites `export_date`, so column A doubles as a per-row revision watermark
+# - a sync reads the header and column A only, then fetches just the rows that were
+#   appended or whose watermark changed
+# - a full reload happens on first use, when the header changes or when rows disappear
+# Edits made by hand in the sheet that leave export_date untouched are only picked up
+# by a full reload (reset(), e.g. via the "Clear Google Sheets Cache" button).
+
+import threading, time
+
+WATERMARK_COLUMN = 1  # export_date
+
+
+def _col_letter(n: int) -> str:
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+class SheetMirror:
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self._lock = threading.Lock()
+        self.header = []
+        self.records = []
+        self._watermarks = []
+        # stats
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.rows_fetched = 0
+        self.last_mode = ""
+        self.last_rows_fetched = 0
+        self.last_sync_seconds = 0.0
+
+    def reset(self):
+        with self._lock:
+            self.header = []
+            self.records = []
+            self._watermarks = []
+
+    def _to_record(self, row: list) -> dict:
+        row = list(row) + [""] * (len(self.header) - len(row))
+        return dict(zip(self.header, row))
+
+    def _full_reload(self):
+        values = self.sheet.get_all_values()
+        self.header = values[0] if values else []
+        self.records = [self._to_record(r) for r in values[1:]]
+        self._watermarks = [r.get(self.header[WATERMARK_COLUMN - 1], "") if self.header else "" for r in self.records]
+        self.full_syncs += 1
+        self.last_mode = "full"
+        self.last_rows_fetched = len(self.records)
+
+    def _delta(self) -> bool:
+        """Apply appended/changed rows. Returns False if a full reload is needed."""
+        header = self.sheet.row_values(1)
+        if header != self.header:
+            return False
+        marks = self.sheet.col_values(WATERMARK_COLUMN)[1:]
+        while marks and not marks[-1]:
+            marks.pop()
+        if len(marks) < len(self._watermarks):
+            return False  # rows were deleted; positions no longer line up
+
+        changed = [i for i, (old, new) in enumerate(zip(self._watermarks, marks)) if old != new]
+        last_col = _col_letter(len(self.header))
+        ranges = [f"A{i + 2}:{last_col}{i + 2}" for i in changed]
+        if len(marks) > len(self._watermarks):
+            ranges.append(f"A{len(self._watermarks) + 2}:{last_col}{len(marks) + 1}")
+
+        fetched = 0
+        if ranges:
+            results = self.sheet.batch_get(ranges)
+            for i, rows in zip(changed, results):
+                self.records[i] = self._to_record(rows[0] if rows else [])
+                fetched += 1
+            if len(results) > len(changed):
+                tail = list(results[-1])
+                tail += [[]] * (len(marks) - len(self._watermarks) - len(tail))
+                self.records.extend(self._to_record(r) for r in tail)
+                fetched += len(tail)
+        self._watermarks = marks
+        self.delta_syncs += 1
+        self.last_mode = "delta"
+        self.last_rows_fetched = fetched
+        return True
+
+    def sync(self) -> list:
+        """Bring the mirror up to date and return a copy of the records."""
+        with self._lock:
+            start = time.perf_counter()
+            if not self.header or not self._delta():
+                self._full_reload()
+            self.rows_fetched += self.last_rows_fetched
+            self.last_sync_seconds = time.perf_counter() - start
+            return [dict(r) for r in self.records]
+
+    def row(self, row_number: int):
+        """Copy of one mirrored record by sheet row number (header is row 1), or None."""
+        with self._lock:
+            pos = row_number - 2
+            return dict(self.records[pos]) if 0 <= pos < len(self.records) else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": len(self.records),
+                "full_syncs": self.full_syncs,
+                "delta_syncs": self.delta_syncs,
+                "rows_fetched": self.rows_fetched,
+                "last_mode": self.last_mode,
+                "last_rows_fetched": self.last_rows_fetched,
+                "last_sync_seconds": self.last_sync_seconds,
+            }
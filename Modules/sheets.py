@@ -1,17 +1,26 @@
 # sheets.py
 
+import os, tempfile, threading
 import streamlit as st
 from datetime import datetime
 import pytz
 import gspread
 from google.oauth2.service_account import Credentials
 from Modules.text_utils import canon_title_for_compare
+from Modules.sheet_sync import SheetMirror
+from Modules.shared_snapshot import SharedSnapshot
+from Modules.sheets_client import QuotaAwareSheet
+from Modules.write_queue import WriteBehindQueue, register_queue
+from Modules.srs import REVIEW_COLUMNS
+
+# wall-clock start of the sheet download behind the snapshot this process last read
+_SNAPSHOT = {"fetched_at": 0.0}
 
 def get_hong_kong_time():
     return datetime.now(pytz.timezone('Asia/Hong_Kong'))
 
 @st.cache_resource
-def get_gs_sheet():
+def get_gs_spreadsheet():
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     creds_json = st.secrets.get("GOOGLE_CREDENTIALS_JSON")
     if not creds_json:
@@ -20,7 +29,16 @@ def get_gs_sheet():
     creds_dict = json.loads(creds_json)
     creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
     client = gspread.authorize(creds)
-    return client.open("Chinese Learning Records").sheet1
+    return client.open("Chinese Learning Records")
+
+@st.cache_resource
+def get_gs_sheet():
+    # every caller (sync, write queue, exports) shares one quota budget and retry policy
+    return QuotaAwareSheet(
+        get_gs_spreadsheet().sheet1,
+        read_per_minute=float(st.secrets.get("SHEETS_READS_PER_MINUTE", 60)),
+        write_per_minute=float(st.secrets.get("SHEETS_WRITES_PER_MINUTE", 60)),
+    )
 
 def init_google_sheets():
     try:
@@ -29,24 +47,169 @@ def init_google_sheets():
         st.error(f"Error initializing Google Sheets: {e}")
         return None
 
-@st.cache_data(ttl=30, show_spinner=False)
-def load_gs_data_cached():
+SNAPSHOT_TTL = 30
+META_COLUMNS = ["export_date", "book_title", "article_title", "page_number", "model_used"]
+
+@st.cache_resource
+def get_shared_snapshot() -> SharedSnapshot:
+    path = st.secrets.get("SNAPSHOT_PATH") or os.path.join(tempfile.gettempdir(), "chinese_app_records.snapshot")
+    return SharedSnapshot(path, META_COLUMNS)
+
+def get_snapshot_view():
+    """
+    Memory-mapped record snapshot shared by every worker process on this host.
+    Only the process that wins the refresh lock syncs from the sheet once it is stale.
+    """
     sheet = init_google_sheets()
     if sheet is None:
-        return []
-    return sheet.get_all_records()
+        return None
+    force = _SNAPSHOT.pop("force", False)
+    # only appended / changed rows are downloaded after the first sync
+    view = get_shared_snapshot().refresh_if_stale(get_sheet_mirror().sync, SNAPSHOT_TTL, force)
+    if view is not None:
+        _SNAPSHOT["fetched_at"] = view.created_at
+    return view
+
+def load_snapshot_records():
+    # decoded straight from the shared mmap; a cache_data copy per process would
+    # duplicate the whole record set the snapshot already holds
+    view = get_snapshot_view()
+    return view.records() if view is not None else []
+
+@st.cache_resource
+def get_sheet_mirror() -> SheetMirror:
+    return SheetMirror(get_gs_sheet())
+
+@st.cache_resource
+def get_write_queue() -> WriteBehindQueue:
+    """Process-wide write-behind queue; exports are flushed in batches by its worker."""
+    return register_queue(WriteBehindQueue(get_gs_sheet(), on_append=_relocate_appended))
+
+def _relocate_appended(relocated: list):
+    """Called by the queue worker with (guessed_row, actual_row, record) after each append."""
+    index = _INDEX.get("index")
+    if index is None:
+        return
+    for _, actual, record in relocated:
+        index.relocate(record_key(record.get("book_title", ""), record.get("article_title", ""),
+                                  str(record.get("model_used", ""))), actual)
+
+def write_queue_status() -> dict:
+    try:
+        return get_write_queue().status()
+    except Exception:
+        return {}
+
+def sheets_client_metrics() -> dict:
+    """Per-operation latency / retry / throttle counters of the shared client."""
+    try:
+        return get_gs_sheet().metrics()
+    except Exception:
+        return {}
+
+def _merge_pending(records: list) -> list:
+    try:
+        queue = get_write_queue()
+    except Exception:
+        return records
+    return queue.merge_into(records, _SNAPSHOT["fetched_at"])
+
+def load_records():
+    """Cached sheet snapshot with queued and just-flushed exports merged in."""
+    return [r for r in _merge_pending(load_snapshot_records()) if r]
+
+def load_record_metadata():
+    """
+    Small projection for listing/filtering; `record_id` is the sheet row number.
+    Read from the snapshot view on every call, so only the small metadata blobs are
+    decoded and queued exports show up with their current rows.
+    """
+    view = get_snapshot_view()
+    metas = _merge_pending(view.metadata() if view is not None else [])
+    # placeholders for rows not in the snapshot yet are skipped, not renumbered
+    return [
+        {**{c: r.get(c, "") for c in META_COLUMNS}, "record_id": i + 2}
+        for i, r in enumerate(metas) if r
+    ]
+
+def load_record_body(row: int) -> dict:
+    """One full record by row, from the write queue or the shared snapshot (no sheet call)."""
+    try:
+        pending = get_write_queue().overlay(_SNAPSHOT["fetched_at"]).get(row)
+        if pending:
+            return dict(pending)
+    except Exception:
+        pass
+    view = get_snapshot_view()
+    if view is not None and 0 <= row - 2 < len(view):
+        return view.record(row - 2)
+    return {}
+
+def record_key(book_title: str, article_title: str, model_used: str) -> tuple:
+    """Canonical (book, article, model) key shared by the duplicate check and the upsert."""
+    return (
+        canon_title_for_compare(book_title or ""),
+        canon_title_for_compare(article_title or ""),
+        (model_used or "").strip().lower(),
+    )
+
+class RecordIndex:
+    """
+    In-memory map from record_key() to sheet row number for one snapshot.
+    Built once per snapshot and kept up to date by save_to_gs, so lookups are O(1).
+    """
+
+    def __init__(self, records):
+        """`records` are load_record_metadata() rows; `record_id` is the sheet row."""
+        self._lock = threading.Lock()
+        self._rows = {}
+        for r in records:
+            key = record_key(r.get("book_title", ""), r.get("article_title", ""), str(r.get("model_used", "")))
+            self._rows.setdefault(key, r["record_id"])  # first match wins
+        self._count = max((r["record_id"] - 1 for r in records), default=0)
+
+    def row_for(self, key: tuple):
+        return self._rows.get(key)
+
+    def relocate(self, key: tuple, row: int):
+        """Record where an appended row really landed (other workers may have appended first)."""
+        with self._lock:
+            self._rows[key] = row
+            self._count = max(self._count, row - 1)
+
+    def add(self, key: tuple) -> int:
+        """Register an appended record and return its row number."""
+        with self._lock:
+            self._count += 1
+            row = self._count + 1
+            self._rows.setdefault(key, row)
+            return row
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._rows
+
+    def __len__(self) -> int:
+        return self._count
+
+# the index currently handed out, so the queue worker (outside any script run) can correct it
+_INDEX = {}
+
+@st.cache_resource(ttl=30, show_spinner=False)
+def get_record_index() -> RecordIndex:
+    index = _INDEX["index"] = RecordIndex(load_record_metadata())
+    return index
+
+def clear_gs_caches():
+    """Drop every cached copy so the next read is a full reload."""
+    try:
+        get_sheet_mirror().reset()
+    except Exception:
+        pass
+    _SNAPSHOT["force"] = True
+    get_record_index.clear()
 
 def check_record_exists(book_title: str, article_title: str, model_used: str) -> bool:
-    records = load_gs_data_cached()
-    bt_key = canon_title_for_compare(book_title)
-    at_key = canon_title_for_compare(article_title)
-    mu_key = (model_used or "").strip().lower()
-    for r in records:
-        if (canon_title_for_compare(r.get("book_title","")) == bt_key and
-            canon_title_for_compare(r.get("article_title","")) == at_key and
-            r.get("model_used","").strip().lower() == mu_key):
-            return True
-    return False
+    return record_key(book_title, article_title, model_used) in get_record_index()
 
 def save_to_gs(text_data, keywords, dictionary_data, model_used, book_title="", article_title="", page_number=""):
     try:
@@ -54,7 +217,7 @@ def save_to_gs(text_data, keywords, dictionary_data, model_used, book_title="",
         if sheet is None:
             return 0
 
-        records = load_gs_data_cached()
+        index = get_record_index()
         new_record = {
             "export_date": get_hong_kong_time().strftime("%Y-%m-%d %H:%M:%S"),
             "book_title": book_title.strip(),
@@ -66,22 +229,93 @@ def save_to_gs(text_data, keywords, dictionary_data, model_used, book_title="",
             "model_used": model_used.strip()
         }
 
-        record_index = None
-        for i, r in enumerate(records):
-            if (r["book_title"].strip().lower() == book_title.strip().lower() and
-                r["article_title"].strip().lower() == article_title.strip().lower() and
-                r["model_used"].strip().lower() == model_used.strip().lower()):
-                record_index = i + 2  # header + 1-based
-                break
+        key = record_key(book_title, article_title, model_used)
+        record_index = index.row_for(key)
 
-        values = list(new_record.values())
+        # queued for the background worker; readers see it via load_records() right away
         if record_index:
-            sheet.update(f"A{record_index}:H{record_index}", [values])
-            load_gs_data_cached.clear()
+            get_write_queue().enqueue(record_index, new_record, is_append=False)
         else:
-            sheet.append_row(values)
-            load_gs_data_cached.clear()
-        return len(records) + (0 if record_index else 1)
+            get_write_queue().enqueue(index.add(key), new_record, is_append=True)
+        return len(index)
     except Exception as e:
         st.error(f"Error saving to Google Sheets: {e}")
         return 0
+
+# ---------- spaced-repetition review state ("reviews" worksheet next to the records) ----------
+REVIEW_SHEET = "reviews"
+_REVIEW_LOCK = threading.Lock()  # one review write at a time per process (lookup + write)
+
+@st.cache_resource
+def get_review_sheet():
+    """The reviews worksheet, or None until ensure_review_sheet() has created it."""
+    try:
+        worksheet = get_gs_spreadsheet().worksheet(REVIEW_SHEET)
+    except gspread.WorksheetNotFound:
+        return None
+    return get_gs_sheet().sibling(worksheet)
+
+def ensure_review_sheet():
+    """Create the reviews worksheet (with its header row) if it does not exist yet."""
+    sheet = get_review_sheet()
+    if sheet is not None:
+        return sheet
+    spreadsheet = get_gs_spreadsheet()
+    try:
+        worksheet = spreadsheet.worksheet(REVIEW_SHEET)  # another process may have created it
+    except gspread.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(REVIEW_SHEET, rows=1000, cols=len(REVIEW_COLUMNS))
+        worksheet.append_row(REVIEW_COLUMNS)
+    get_review_sheet.clear()
+    return get_gs_sheet().sibling(worksheet)
+
+def _review_state(row: list):
+    """State dict of one reviews-sheet row, or None if the row is blank or malformed."""
+    if not row or not row[0]:
+        return None
+    values = dict(zip(REVIEW_COLUMNS, row))
+    try:
+        return {c: (int if c in ("reps", "lapses") else float)(values.get(c) or 0)
+                for c in REVIEW_COLUMNS[1:]}
+    except ValueError:
+        return None
+
+def load_review_states() -> dict:
+    """review_key -> state dict for every reviewed record; raises if the sheet cannot be read."""
+    sheet = get_review_sheet()
+    states = {}
+    for row in (sheet.get_all_values() if sheet is not None else [])[1:]:
+        state = _review_state(row)
+        if state is not None:
+            states[row[0]] = state
+    return states
+
+def load_review_state(key: str):
+    """Stored state of one record straight from the sheet (None if never reviewed)."""
+    sheet = get_review_sheet()
+    if sheet is None:
+        return None
+    keys = sheet.col_values(1)
+    if key not in keys:
+        return None
+    return _review_state(sheet.row_values(keys.index(key) + 1))
+
+def save_review_state(key: str, state: dict) -> bool:
+    """
+    Write one review state. The row is looked up by review_key right before the write,
+    so appends from other processes never shift it onto someone else's row.
+    """
+    values = [key] + [state[c] for c in REVIEW_COLUMNS[1:]]
+    try:
+        with _REVIEW_LOCK:
+            sheet = ensure_review_sheet()
+            keys = sheet.col_values(1)
+            if key in keys:
+                row = keys.index(key) + 1
+                sheet.update(f"A{row}:{chr(ord('A') + len(REVIEW_COLUMNS) - 1)}{row}", [values])
+            else:
+                sheet.append_row(values)
+        return True
+    except Exception as e:
+        st.error(f"Error saving review schedule: {e}")
+        return False
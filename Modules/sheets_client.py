@@ -0,0 +1,135 @@
+# sheets_client.py
+# Quota-aware wrapper around a gspread worksheet.
+# - token buckets matched to the Sheets per-minute read / write quotas, so bursts wait
+#   for a token instead of tripping a 429
+# - 429 / 5xx responses are retried with jittered exponential backoff; appends are only
+#   retried on 429 (the request was rejected), since a 5xx or timeout may have added the row
+# - per-operation latency, retry, throttle and error counters
+# Any method that is not wrapped is passed straight through to the worksheet.
+
+import random, threading, time
+
+READ_METHODS = ("get_all_values", "get_all_records", "row_values", "col_values", "batch_get", "get")
+WRITE_METHODS = ("update", "batch_update", "append_row", "append_rows")
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# not idempotent: retrying after the row may already have landed would duplicate it
+APPEND_METHODS = ("append_row", "append_rows")
+
+
+def _status_code(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_rate_limited(exc) -> bool:
+    code = _status_code(exc)
+    if code is not None:
+        return code == 429
+    msg = str(exc).lower()
+    return "429" in msg or "quota" in msg or "rate limit" in msg
+
+def is_retryable(exc, idempotent: bool = True) -> bool:
+    code = _status_code(exc)
+    if not idempotent or code is None:
+        return is_rate_limited(exc)
+    return code in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """`per_minute` tokens refilled continuously, bursts of up to `capacity`."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or max(1.0, per_minute / 6)  # ~10 s worth of burst
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping if needed; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class QuotaAwareSheet:
+    def __init__(self, worksheet, read_per_minute: float = 60, write_per_minute: float = 60,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 32.0):
+        self._ws = worksheet
+        self._buckets = {"read": TokenBucket(read_per_minute), "write": TokenBucket(write_per_minute)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    def sibling(self, worksheet) -> "QuotaAwareSheet":
+        """Wrap another worksheet of the same spreadsheet, sharing quota buckets and metrics."""
+        other = QuotaAwareSheet(worksheet, max_retries=self.max_retries,
+                                base_delay=self.base_delay, max_delay=self.max_delay)
+        other._buckets = self._buckets
+        other._metrics = self._metrics
+        other._metrics_lock = self._metrics_lock
+        return other
+
+    def __getattr__(self, name):
+        attr = getattr(self._ws, name)
+        if name in READ_METHODS:
+            kind = "read"
+        elif name in WRITE_METHODS:
+            kind = "write"
+        else:
+            return attr
+        return lambda *args, **kwargs: self._call(name, kind, attr, args, kwargs)
+
+    def _record(self, op: str, **deltas):
+        with self._metrics_lock:
+            m = self._metrics.setdefault(op, {
+                "calls": 0, "errors": 0, "retries": 0, "throttled": 0,
+                "throttle_seconds": 0.0, "total_seconds": 0.0, "max_seconds": 0.0,
+            })
+            for k, v in deltas.items():
+                if k == "max_seconds":
+                    m[k] = max(m[k], v)
+                else:
+                    m[k] += v
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter: uniform(0, min(max_delay, base * 2^attempt))
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call(self, op, kind, fn, args, kwargs):
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                waited = self._buckets[kind].acquire()
+                if waited:
+                    self._record(op, throttled=1, throttle_seconds=waited)
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e, op not in APPEND_METHODS):
+                        self._record(op, errors=1)
+                        raise
+                    self._record(op, retries=1)
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(op, calls=1, total_seconds=elapsed, max_seconds=elapsed)
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            out = {}
+            for op, m in self._metrics.items():
+                out[op] = dict(m, avg_seconds=m["total_seconds"] / m["calls"] if m["calls"] else 0.0)
+            return out
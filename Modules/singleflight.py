@@ -0,0 +1,90 @@
+# singleflight.py
+# Process-wide coalescing of identical in-flight requests.
+# When several sessions ask for the same thing at once (a projected lesson opened by a
+# whole class), the first caller does the work and the others wait for its result.
+# Nothing is cached: once the call finishes, the next request starts a new one.
+# A leader that gives up without a result (a stream abandoned by a rerun) releases with
+# FlightAbandoned; its waiters then start the call again instead of failing.
+
+import threading
+
+
+class FlightAbandoned(RuntimeError):
+    """The leader stopped before producing a result; nothing went wrong with the call itself."""
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {}
+
+    def _count(self, kind: str, name: str):
+        s = self._stats.setdefault(kind, {"calls": 0, "coalesced": 0})
+        s[name] += 1
+
+    def acquire(self, kind: str, key):
+        """(flight, is_leader); the leader must call release() exactly once."""
+        with self._lock:
+            self._count(kind, "calls")
+            flight = self._flights.get((kind, key))
+            if flight is not None:
+                flight.waiters += 1
+                self._count(kind, "coalesced")
+                return flight, False
+            flight = self._flights[(kind, key)] = _Flight()
+            return flight, True
+
+    def release(self, kind: str, key, flight: _Flight, result=None, error: BaseException = None):
+        with self._lock:
+            if self._flights.get((kind, key)) is flight:
+                del self._flights[(kind, key)]
+        flight.result, flight.error = result, error
+        flight.event.set()
+
+    @staticmethod
+    def wait(flight: _Flight):
+        """Result of the leader's call (re-raises its error)."""
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, kind: str, key, fn):
+        """Run fn() once for all concurrent callers with the same (kind, key)."""
+        while True:
+            flight, leader = self.acquire(kind, key)
+            if leader:
+                break
+            try:
+                return self.wait(flight)
+            except FlightAbandoned:
+                continue  # the leader went away: run it again (one waiter leads the retry)
+        try:
+            result = fn()
+        except BaseException as e:
+            self.release(kind, key, flight, error=e)
+            raise
+        self.release(kind, key, flight, result=result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {kind: dict(s, in_flight=sum(1 for k in self._flights if k[0] == kind))
+                    for kind, s in self._stats.items()}
+
+
+_FLIGHTS = SingleFlight()
+
+def get_singleflight() -> SingleFlight:
+    return _FLIGHTS
@@ -0,0 +1,99 @@
+# srs.py
+# Spaced-repetition scheduling for archived lessons.
+# - review state per record: due time, interval (days), ease, repetitions, lapses
+# - schedule(): a simplified SM-2 update for the grades again / hard / good / easy
+# - DueQueue: min-heap keyed by next due time with lazy invalidation, so
+#   "what's due now" pops only the due items (O(k log n)) instead of scanning everything
+
+import heapq, threading, time
+
+DAY = 86400.0
+GRADES = {"again": 0, "hard": 1, "good": 2, "easy": 3}
+REVIEW_COLUMNS = ["review_key", "due", "interval", "ease", "reps", "lapses", "last_review"]
+
+
+def review_key(record: dict) -> str:
+    """Stable key for a lesson (exported titles are already normalized to Traditional)."""
+    return "|".join(str(record.get(k, "") or "").strip().lower()
+                    for k in ("book_title", "article_title", "model_used"))
+
+def new_state() -> dict:
+    return {"due": 0.0, "interval": 0.0, "ease": 2.5, "reps": 0, "lapses": 0, "last_review": 0.0}
+
+def schedule(state: dict, grade: str, now: float = None) -> dict:
+    """Return the next review state after answering with `grade`."""
+    now = time.time() if now is None else now
+    q = GRADES[grade]
+    s = dict(new_state(), **(state or {}))
+    if q == 0:
+        s["reps"] = 0
+        s["lapses"] += 1
+        s["interval"] = 10 / 1440  # relearn in 10 minutes
+        s["ease"] = max(1.3, s["ease"] - 0.2)
+    else:
+        s["reps"] += 1
+        if s["reps"] == 1:
+            s["interval"] = 1.0
+        elif s["reps"] == 2:
+            s["interval"] = 3.0
+        else:
+            s["interval"] = s["interval"] * s["ease"]
+        s["ease"] = max(1.3, s["ease"] + {1: -0.15, 2: 0.0, 3: 0.15}[q])
+        if q == 1:
+            s["interval"] = max(1.0, s["interval"] * 0.6)
+        elif q == 3:
+            s["interval"] *= 1.3
+    s["last_review"] = now
+    s["due"] = now + s["interval"] * DAY
+    return s
+
+
+class DueQueue:
+    """Min-heap of (due, key); stale heap entries are skipped when they surface."""
+
+    def __init__(self, states: dict = None):
+        self._lock = threading.Lock()
+        self._due = {}
+        self._heap = []
+        for key, state in (states or {}).items():
+            self._due[key] = float(state.get("due", 0) or 0)
+        self._heap = [(due, key) for key, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def update(self, key: str, due: float):
+        with self._lock:
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, key))
+            if len(self._heap) > 2 * len(self._due) + 64:
+                # too many stale entries: rebuild
+                self._heap = [(d, k) for k, d in self._due.items()]
+                heapq.heapify(self._heap)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._due.pop(key, None)
+
+    def due(self, now: float = None, limit: int = 50) -> list:
+        """Keys due at `now`, most overdue first."""
+        now = time.time() if now is None else now
+        out, popped = [], []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(out) < limit:
+                due, key = heapq.heappop(self._heap)
+                if self._due.get(key) != due:
+                    continue  # superseded or removed
+                out.append(key)
+                popped.append((due, key))
+            for item in popped:
+                heapq.heappush(self._heap, item)
+        return out
+
+    def next_due(self):
+        """Earliest upcoming due time, or None."""
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
@@ -1,22 +1,29 @@
 # tab1_typo_checker.py
 import os
+import re
 import unicodedata
 import streamlit as st
-from Modules.text_utils import normalize_input_cached, highlight_words_dual
+from Modules.text_utils import normalize_input_cached, highlight_words_dual, get_keyword_automaton, iter_paragraphs
 from Modules.storage import save_to_temp_file, load_from_temp_file, get_temp_dir
-from Modules.ai import call_ai_model
+from Modules.ai import stream_ai_model, run_ai_batch, is_error_response, last_ai_failed
 
+# Long OCR passages are checked in chunks of about this many characters (≈ tokens for
+# Chinese), in parallel; shorter ones go out as a single streamed prompt
+TYPO_CHUNK_CHARS = 1200
+TYPO_CONCURRENCY = 4
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])")
 
-def _parse_markdown_table(response_text: str):
+
+def _parse_markdown_table(response_text: str, with_notes: bool = False):
     """
     Parse markdown table rows like:
     | 錯字 | 正確 | 解釋 |
     |  A   |  B   |  ... |
-    Returns (typo_list, ai_correct_list).
+    Returns (typo_list, ai_correct_list), plus the 解釋 list if with_notes.
     """
-    typo_list, ai_correct_list = [], []
+    typo_list, ai_correct_list, notes = [], [], []
     if not response_text:
-        return typo_list, ai_correct_list
+        return (typo_list, ai_correct_list, notes) if with_notes else (typo_list, ai_correct_list)
 
     for line in response_text.splitlines():
         line = line.strip()
@@ -33,8 +40,65 @@ def _parse_markdown_table(response_text: str):
         if typo and correct and typo != "此課文沒有錯字":
             typo_list.append(typo)
             ai_correct_list.append(correct)
+            notes.append(cells[2] if len(cells) > 2 else "")
+
+    return (typo_list, ai_correct_list, notes) if with_notes else (typo_list, ai_correct_list)
+
+
+def _typo_prompt(text_trad: str) -> str:
+    return f"""
+I just copied the following Chinese text from an image I took using OCR, I will need to study this text for my homework and want to make sure the OCR has not picked up the wrong words. Please carefully review the passage for any incorrect, uncommon, or misused characters:
+
+\"{text_trad}\"
+
+If there are any issues, list the typo in a markdown table format with the following columns:
+Column 1 - heading = "錯字", content = problematic character or phrase
+Column 2 - heading = "正確", content = correct character or phrase
+Column 3 - heading = "解釋", content = Using Chinese, explain why they are incorrect or unusual
+
+Please respond only in Traditional Chinese. If the text is clean, simply respond: "此課文沒有錯字 in column 1"
+"""
+
 
-    return typo_list, ai_correct_list
+def _chunk_text(text: str, budget: int = TYPO_CHUNK_CHARS) -> list:
+    """Split on paragraph, then sentence boundaries into chunks of at most ~budget characters."""
+    units = []
+    for paragraph in iter_paragraphs(text):
+        if len(paragraph) <= budget:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            # a single over-long "sentence" (no punctuation from OCR) is cut as-is
+            units.extend(sentence[i:i + budget] for i in range(0, len(sentence), budget) if sentence[i:i + budget])
+    chunks, current = [], ""
+    for unit in units:
+        if current and len(current) + len(unit) + 2 > budget:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _check_in_chunks(text_trad: str) -> str:
+    """Check chunks concurrently and merge their tables into one de-duplicated table."""
+    responses = run_ai_batch([_typo_prompt(c) for c in _chunk_text(text_trad)], TYPO_CONCURRENCY)
+    errors = [r for r in responses if is_error_response(r)]
+    if errors and len(errors) == len(responses):
+        return errors[0]
+    rows, seen = [], set()
+    for response in responses:
+        if is_error_response(response):
+            continue
+        for typo, correct, note in zip(*_parse_markdown_table(response, with_notes=True)):
+            if (typo, correct) not in seen:
+                seen.add((typo, correct))
+                rows.append(f"| {typo} | {correct} | {note} |")
+    table = "\n".join(["| 錯字 | 正確 | 解釋 |", "|---|---|---|"] + rows) if rows else "此課文沒有錯字"
+    if errors:
+        table += f"\n\n⚠️ {len(errors)} / {len(responses)} 段未能檢查：{errors[0]}"
+    return table
 
 
 def render():
@@ -60,7 +124,8 @@ def render():
     if not os.path.exists(os.path.join(get_temp_dir(), "last_typo_check_response.txt")):
         save_to_temp_file("", "last_typo_check_response.txt")
 
-    # 4) Handle click → call AI, parse, persist
+    # 4) Handle click → call AI (streamed as it is generated), parse, persist
+    streamed = False
     if check_clicked:
         if not text_input:
             st.warning("Please enter some text first.")
@@ -70,20 +135,22 @@ def render():
         # Normalize only when needed
         text_trad, text_simp = normalize_input_cached(text_input)
 
-        prompt_check = f"""
-I just copied the following Chinese text from an image I took using OCR, I will need to study this text for my homework and want to make sure the OCR has not picked up the wrong words. Please carefully review the passage for any incorrect, uncommon, or misused characters:
-
-\"{text_trad}\"
-
-If there are any issues, list the typo in a markdown table format with the following columns:
-Column 1 - heading = "錯字", content = problematic character or phrase
-Column 2 - heading = "正確", content = correct character or phrase
-Column 3 - heading = "解釋", content = Using Chinese, explain why they are incorrect or unusual
-
-Please respond only in Traditional Chinese. If the text is clean, simply respond: "此課文沒有錯字 in column 1"
-"""
         try:
-            response_check = call_ai_model(prompt_check)
+            st.subheader("錯字檢查結果：")
+            if len(text_trad) > TYPO_CHUNK_CHARS:
+                # long passage: chunks are checked in parallel, so latency stays near one chunk's
+                with st.spinner("正在分段檢查錯字…"):
+                    response_check = _check_in_chunks(text_trad)
+                st.write(response_check)
+                failed = is_error_response(response_check)
+            else:
+                response_check = st.write_stream(stream_ai_model(_typo_prompt(text_trad)))
+                failed = last_ai_failed()
+            if failed:
+                # the error is already on screen; nothing is parsed or saved
+                st.session_state.tab1_checked = False
+                return
+            streamed = True
             save_to_temp_file(response_check, "last_typo_check_response.txt")
 
             # parse rows into lists
@@ -114,10 +181,11 @@ Please respond only in Traditional Chinese. If the text is clean, simply respond
     # Normalize current text for rendering
     text_trad, text_simp = normalize_input_cached(text_input) if text_input else ("", "")
 
-    # 6) Show AI’s table or message
-    st.subheader("錯字檢查結果：")
-    if last_response:
-        st.write(last_response)
+    # 6) Show AI’s table or message (already on screen if it was just streamed)
+    if not streamed:
+        st.subheader("錯字檢查結果：")
+        if last_response:
+            st.write(last_response)
 
     # 7) If no typos → show original Traditional + message
     if not typo_list:
@@ -150,28 +218,28 @@ Please respond only in Traditional Chinese. If the text is clean, simply respond
     st.write("如果你想刪除錯字，就留空。")
 
     # --- ORIGINAL TEXT with RED highlights (suspected typos) ---
-    highlighted_trad, highlighted_simp = text_trad, text_simp
-    for typo in typo_list:
-        typo_norm = unicodedata.normalize('NFKC', typo)
-        highlighted_trad, highlighted_simp = highlight_words_dual(
-            highlighted_trad, highlighted_simp, typo_norm,
-            highlight_style="background-color:#ffcccc;"   # 🔴 RED
-        )
+    highlighted_trad, highlighted_simp = highlight_words_dual(
+        text_trad, text_simp,
+        ",".join(unicodedata.normalize('NFKC', typo) for typo in typo_list),
+        highlight_style="background-color:#ffcccc;"   # 🔴 RED
+    )
 
     # --- CORRECTED TEXT (YELLOW = kept AI; GREEN = changed by user) ---
-    corrected_trad = text_trad
+    replacements = {}
     for typo, ai_word, user_word in zip(typo_list, ai_correct_list, user_correct_list):
+        if typo in replacements:
+            continue
         if user_word.strip():
             # Compare using normalized Traditional forms to decide color
             ai_norm, _ = normalize_input_cached(ai_word)
             user_norm, _ = normalize_input_cached(user_word)
             color = "#ffffcc" if user_norm == ai_norm else "#d0f0c0"  # 🟡 or 🟢
-            corrected_trad = corrected_trad.replace(
-                typo, f'<span style="background-color:{color};">{user_word}</span>'
-            )
+            replacements[typo] = f'<span style="background-color:{color};">{user_word}</span>'
         else:
             # If user clears the field, remove the typo from corrected text
-            corrected_trad = corrected_trad.replace(typo, "")
+            replacements[typo] = ""
+    # one pass over the text, so replacements never touch inserted markup
+    corrected_trad = get_keyword_automaton(tuple(replacements)).sub(text_trad, replacements.get)
 
     # 9) Render side-by-side
     col1, col2 = st.columns([1, 1])
@@ -2,7 +2,7 @@
 # Matches your original Tab 2 behavior:
 # - file-based temp storage for state/perf
 # - st.rerun() to reveal overwrite / save-as UI
-# - save_to_gs() used for BOTH create and overwrite
+# - record store upsert() used for BOTH create and overwrite
 # Changes vs your last version:
 # - Adds "課文顯示" (normalized Trad/Simp) immediately when passage is entered
 # - Moves the small heading "📘字典解釋 - 關鍵詞語" above the keywords input
@@ -10,10 +10,26 @@
 # - Reorganizes layout to move buttons below text display
 
 import streamlit as st
-from Modules.text_utils import normalize_input_cached, highlight_words_dual
+from Modules.text_utils import normalize_input_cached, ParagraphPipeline
 from Modules.storage import load_from_temp_file, save_to_temp_file
-from Modules.ai import call_ai_model
-from Modules.sheets import check_record_exists, save_to_gs
+from Modules.ai import stream_ai_model, last_ai_provider, last_ai_failed
+from Modules.record_store import get_record_store
+from Modules.dictionary import DictionaryStore
+
+
+@st.cache_resource
+def get_dictionary_store() -> DictionaryStore:
+    """Process-wide per-word dictionary; DICTIONARY_PATH in secrets sets the database file."""
+    return DictionaryStore(st.secrets.get("DICTIONARY_PATH", "chinese_dictionary.db"))
+
+
+def _paragraph_html(paragraph: str) -> str:
+    return f'<div class="chinese-text-teaching">{paragraph}</div>'
+
+
+def _full_trad(text: str) -> str:
+    """Whole-passage Traditional text, only needed for prompts and export."""
+    return normalize_input_cached(text)[0] if text else ""
 
 
 def render():
@@ -40,71 +56,29 @@ def render():
         save_to_temp_file(text_input_tab2, "tab2_text.txt")
         # Clear dictionary data when text changes
         save_to_temp_file("", "dictionary_data.txt")
-    
-    if text_input_tab2:
-        text_trad_tab2, text_simp_tab2 = normalize_input_cached(text_input_tab2)
-        Lookup_text_tab2 = text_trad_tab2
+        save_to_temp_file("", "dictionary_model.txt")
     
     if text_input_tab2:
         
-        # Replace the column layout with tabs
+        words_trad = ""
+        if 'words_input_tab2' in st.session_state and st.session_state.words_input_tab2:
+            # Normalize the words input
+            words_trad, words_simp = normalize_input_cached(st.session_state.words_input_tab2)
+
+        # Replace the column layout with tabs; each gets a scrollable container
         trad_tab, simp_tab = st.tabs(["繁體中文", "簡體中文"])
-        
         with trad_tab:
-            # Display the traditional text
-            if 'words_input_tab2' in st.session_state and st.session_state.words_input_tab2:
-                # Normalize the words input
-                words_trad, words_simp = normalize_input_cached(st.session_state.words_input_tab2)
-                # Use the normalized version for processing
-                highlighted_trad, highlighted_simp = highlight_words_dual(text_trad_tab2, text_simp_tab2, words_trad)
-                
-                # Split the text into paragraphs and build the full HTML content
-                paragraphs = highlighted_trad.split('\n\n')
-                html_content = '<div class="scrollable-text">'
-                for paragraph in paragraphs:
-                    if paragraph.strip():  # Only include non-empty paragraphs
-                        html_content += f'<div class="chinese-text-teaching">{paragraph}</div><br>'
-                html_content += '</div>'
-                
-                # Display the entire content in a single markdown call
-                st.markdown(html_content, unsafe_allow_html=True)
-            else:
-                # Display plain text without highlighting, but with proper formatting
-                paragraphs = text_trad_tab2.split('\n\n')
-                html_content = '<div class="scrollable-text">'
-                for paragraph in paragraphs:
-                    if paragraph.strip():  # Only include non-empty paragraphs
-                        html_content += f'<div class="chinese-text-teaching">{paragraph}</div><br>'
-                html_content += '</div>'
-                st.markdown(html_content, unsafe_allow_html=True)
-
+            trad_box = st.container(height=400)
         with simp_tab:
-            # Display the simplified text
-            if 'words_input_tab2' in st.session_state and st.session_state.words_input_tab2:
-                # Normalize the words input
-                words_trad, words_simp = normalize_input_cached(st.session_state.words_input_tab2)
-                # Use the normalized version for processing
-                highlighted_trad, highlighted_simp = highlight_words_dual(text_trad_tab2, text_simp_tab2, words_trad)
-                
-                # Split the text into paragraphs and build the full HTML content
-                paragraphs = highlighted_simp.split('\n\n')
-                html_content = '<div class="scrollable-text">'
-                for paragraph in paragraphs:
-                    if paragraph.strip():  # Only include non-empty paragraphs
-                        html_content += f'<div class="chinese-text-teaching">{paragraph}</div><br>'
-                html_content += '</div>'
-                
-                # Display the entire content in a single markdown call
-                st.markdown(html_content, unsafe_allow_html=True)
-            else:
-                # Display plain text without highlighting, but with proper formatting
-                paragraphs = text_simp_tab2.split('\n\n')
-                html_content = '<div class="scrollable-text">'
-                for paragraph in paragraphs:
-                    if paragraph.strip():  # Only include non-empty paragraphs
-                        html_content += f'<div class="chinese-text-teaching">{paragraph}</div><br>'
-                html_content += '</div>'
-                st.markdown(html_content, unsafe_allow_html=True)
+            simp_box = st.container(height=400)
+
+        # Stream paragraph by paragraph so long passages render progressively;
+        # the session pipeline only recomputes paragraphs that changed since the last run
+        if "tab2_pipeline" not in st.session_state:
+            st.session_state.tab2_pipeline = ParagraphPipeline()
+        for para_trad, para_simp in st.session_state.tab2_pipeline.render(text_input_tab2, words_trad):
+            trad_box.markdown(_paragraph_html(para_trad), unsafe_allow_html=True)
+            simp_box.markdown(_paragraph_html(para_simp), unsafe_allow_html=True)
 
     
     # Move the "辨認關鍵詞語" button and words input below the text display
@@ -116,6 +90,7 @@ def render():
             if not text_input_tab2:
                 st.warning("Please enter some text first.")
             else:
+                Lookup_text_tab2 = _full_trad(text_input_tab2)
                 prompt_words = f"""
                 You are a Chinese native speaker, being a language tutor for a 12 year old student.
                 Please identify the key complex vocabulary in the passage in "{Lookup_text_tab2}", 
@@ -123,11 +98,11 @@ def render():
                 Respond only in Traditional Chinese, separate the words with commas.
                 """
                 try:
-                    response_words = call_ai_model(prompt_words)
-                    # Save the identified keywords to a separate file (not the words input)
-                    save_to_temp_file(response_words, "ai_suggested_keywords.txt")
                     st.subheader(f"{st.session_state.selected_model} 辨認關鍵詞:")
-                    st.write(response_words)
+                    response_words = st.write_stream(stream_ai_model(prompt_words))
+                    # Save the identified keywords to a separate file (not the words input)
+                    if not last_ai_failed():
+                        save_to_temp_file(response_words, "ai_suggested_keywords.txt")
                                     
                 except Exception as e:
                     st.error(f"❌ An unexpected error occurred: {e}")
@@ -161,6 +136,7 @@ def render():
             save_to_temp_file(words_input_tab2, "tab2_words.txt")
             # Clear dictionary data when words change
             save_to_temp_file("", "dictionary_data.txt")
+            save_to_temp_file("", "dictionary_model.txt")
             # Rerun to update the highlighted text
             st.rerun()
     
@@ -176,35 +152,46 @@ def render():
             # Normalize the words input
             words_trad, words_simp = normalize_input_cached(words_input_tab2)
             
-            prompt_dict = f"""
-            You are a Chinese native speaker, being a language tutor for kids 8-10 years old.
-
-            Please explain the words in "{words_trad}" in Traditional Chinese using Markdown table format with the following columns:
-
-            Column 1: Heading = "繁體", content = the original character in traditional chinese
-            Column 2: Heading = "簡體", content = convert the column 1 characters into simplified chinese
-            Column 3: Heading = "拼音", content = Mandarin pinyin  
-            Column 4: Heading = "解釋", content = A beginner-friendly, simple definition  
-            Column 5 & 6: Heading = "例句", content = An example sentence, show in both traditional (column 5) and simplified chinese
-
-            Respond only in Traditional Chinese. Format your response as a Markdown table.
-            """
             try:
-                response_dict = call_ai_model(prompt_dict)
-                save_to_temp_file(response_dict, "dictionary_data.txt")
-                dictionary_data = response_dict
-                st.session_state.model_used = st.session_state.selected_model
-                st.rerun()  # Rerun to display the updated dictionary
+                # Stored per word and model: only words never looked up go to the AI,
+                # and that part of the table streams in while it is generated
+                st.subheader(f"{st.session_state.selected_model} Dictionary:")
+                response_dict, error, answered_by, missing_words = get_dictionary_store().lookup(
+                    words_trad, st.session_state.selected_model,
+                    lambda prompt: (st.write_stream(stream_ai_model(prompt)), last_ai_provider(), last_ai_failed()),
+                )
+                if error:
+                    st.error(error)
+                else:
+                    save_to_temp_file(response_dict, "dictionary_data.txt")
+                    dictionary_data = response_dict
+                    # the provider that actually answered (after any failover) is exported
+                    save_to_temp_file(answered_by, "dictionary_model.txt")
+                    if missing_words:
+                        # not in the saved table; kept on screen (no rerun) until looked up again
+                        st.warning(f"以下詞語未能取得解釋，請再按「字典」查一次：{'、'.join(missing_words)}")
+                    else:
+                        st.rerun()  # Rerun to display the updated dictionary
             except Exception as e:
                 st.error(f"❌ An unexpected error occurred: {e}")
     
+    # Model that wrote the dictionary (differs from the selection after a failover);
+    # without a dictionary the export is tagged with the selected model
+    model_used = (dictionary_data and load_from_temp_file("dictionary_model.txt", "")) or st.session_state.selected_model
+
     # Display dictionary response if it exists
     if dictionary_data:
-        st.subheader(f"{st.session_state.selected_model} Dictionary:")
+        st.subheader(f"{model_used} Dictionary:")
         st.markdown(dictionary_data)
 
     # --- Export section (original save-to-temp + st.rerun flow) ---
     st.header("💾 匯出學習資料")
+    queue_status = get_record_store().status()
+    if queue_status.get("pending") or queue_status.get("last_error"):
+        st.caption(
+            f"待寫入 {get_record_store().name}: {queue_status.get('pending', 0)} 條"
+            + (f"｜上次寫入錯誤: {queue_status['last_error']}" if queue_status.get("last_error") else "")
+        )
     export_container = st.container()
 
     with export_container:
@@ -237,7 +224,8 @@ def render():
         show_new_name_inputs = load_from_temp_file("show_new_name_inputs.txt", "False") == "True"
 
         # Export button
-        if st.button("匯出到數據庫(Google Sheet)", key="export"):
+        if st.button(f"匯出到數據庫({get_record_store().name})", key="export"):
+            text_trad_tab2 = _full_trad(text_input_tab2)
             if not text_trad_tab2 or not text_trad_tab2.strip():
                 st.warning("請先輸入課文內容（上方文字框）。")
                 return
@@ -251,8 +239,8 @@ def render():
             if not book_title or not article_title:
                 st.error("請填寫書名和文章標題。")
             else:
-                exists = check_record_exists(
-                    book_title_trad, article_title_trad, st.session_state.selected_model
+                exists = get_record_store().exists(
+                    book_title_trad, article_title_trad, model_used
                 )
                 if exists:
                     st.warning("已存在相同書名、文章標題和AI模型的記錄。")
@@ -262,9 +250,9 @@ def render():
                 else:
                     trad_original = text_trad_tab2
                     trad_keywords = words_trad
-                    record_count = save_to_gs(
+                    record_count = get_record_store().upsert(
                         trad_original, trad_keywords, dictionary_data,
-                        st.session_state.selected_model, book_title_trad, article_title_trad, page_number
+                        model_used, book_title_trad, article_title_trad, page_number
                     )
                     if record_count > 0:
                         st.success(f"資料已成功匯出！數據庫中現在有 {record_count} 條記錄。")
@@ -273,18 +261,18 @@ def render():
                     else:
                         st.error("匯出失敗，請檢查錯誤信息。")
 
-        # Overwrite options (original logic, using save_to_gs for overwrite)
+        # Overwrite options (original logic, using upsert for overwrite)
         if show_overwrite_options:
             st.info("請選擇如何處理重複記錄：")
             col1, col2, col3 = st.columns(3)
 
             with col1:
                 if st.button("覆蓋現有記錄", key="overwrite_confirm"):
-                    trad_original = text_trad_tab2
+                    trad_original = _full_trad(text_input_tab2)
                     words_trad = normalize_input_cached(words_input_tab2)[0] if words_input_tab2 else ""
-                    record_count = save_to_gs(
+                    record_count = get_record_store().upsert(
                         trad_original, words_trad, load_from_temp_file("dictionary_data.txt", ""),
-                        st.session_state.selected_model, book_title_trad, article_title_trad, page_number
+                        model_used, book_title_trad, article_title_trad, page_number
                     )
                     if record_count > 0:
                         st.success("記錄已更新！")
@@ -314,11 +302,11 @@ def render():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("確認保存", key="save_with_new_name"):
-                    trad_original = text_trad_tab2
+                    trad_original = _full_trad(text_input_tab2)
                     words_trad = normalize_input_cached(words_input_tab2)[0] if words_input_tab2 else ""
-                    record_count = save_to_gs(
+                    record_count = get_record_store().upsert(
                         trad_original, words_trad, load_from_temp_file("dictionary_data.txt", ""),
-                        st.session_state.selected_model, new_book_title, new_article_title, page_number
+                        model_used, new_book_title, new_article_title, page_number
                     )
                     if record_count > 0:
                         st.success(f"資料已成功匯出！數據庫中現在有 {record_count} 條記錄。")
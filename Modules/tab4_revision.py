@@ -1,8 +1,16 @@
 # tab4_revision.py
 import streamlit as st
-from Modules.sheets import load_gs_data_cached
+from datetime import datetime
+import pytz
+from Modules.record_store import get_record_store
 from Modules.storage import save_to_temp_file, load_from_temp_file
-from Modules.text_utils import normalize_input_cached, highlight_words_dual
+from Modules.facets import facet_index_for
+from Modules.render_cache import RenderCache
+
+@st.cache_resource
+def get_render_cache() -> RenderCache:
+    """Process-wide rendered-lesson cache; set RENDER_CACHE_DIR in secrets to persist it."""
+    return RenderCache(disk_dir=st.secrets.get("RENDER_CACHE_DIR") or None)
 
 def render():
     st.header("📚 複習")
@@ -10,7 +18,9 @@ def render():
     if 'copy_success' not in st.session_state:
         st.session_state.copy_success = False
 
-    records = load_gs_data_cached()
+    # Only the small metadata projection is loaded for filtering and listing
+    store = get_record_store()
+    records = store.load_metadata()
     if not records:
         st.info("尚未有任何匯出的課文資料。請先在「課文學習」標籤中匯出資料。")
         return
@@ -27,41 +37,22 @@ def render():
         if 'page_number' in record and record['page_number'] is not None:
             record['page_number'] = str(record['page_number'])
 
-    # 根据当前筛选条件动态计算可用选项
-    def get_filtered_records(records, filters):
-        filtered = records
-        for key, value in filters.items():
-            if value != "所有":
-                filtered = [r for r in filtered if r[key] == value]
-        return filtered
+    # 倒排索引：每个筛选值对应一个 bitset，筛选与可用选项都由交集计算
+    facets = facet_index_for(records, filter_keys)
 
     # 根据当前筛选条件计算每个筛选器的可用选项
-    def get_filter_options(records, current_filters, exclude_key=None):
+    def get_filter_options(current_filters):
         options = {}
-        
         for key in filter_keys:
-            if key == exclude_key:
-                continue
-                
-            temp_records = records.copy()
-            # 应用其他筛选条件
-            for k, v in current_filters.items():
-                if k != key and k != exclude_key and v != "所有":
-                    temp_records = [r for r in temp_records if r[k] == v]
-            
-            # 获取当前筛选器的可用选项
+            values = facets.options(key, current_filters)
             if key == 'page_number':
-                options[key] = ["所有"] + sorted(
-                    set(r[key] for r in temp_records if r[key]), 
-                    key=lambda x: int(x) if x.isdigit() else x
-                )
+                options[key] = ["所有"] + sorted(values, key=lambda x: int(x) if x.isdigit() else x)
             else:
-                options[key] = ["所有"] + sorted(set(r[key] for r in temp_records if r[key]))
-        
+                options[key] = ["所有"] + sorted(values)
         return options
 
     # 获取所有筛选器的可用选项
-    filter_options = get_filter_options(records, current_filters)
+    filter_options = get_filter_options(current_filters)
 
     # 确保当前值在可用选项中，如果不在则重置为"所有"
     for key in filter_keys:
@@ -99,20 +90,66 @@ def render():
         st.session_state.filter_changed = False
         st.rerun()
 
-    # 获取筛选后的记录
-    filtered_records = get_filtered_records(records, current_filters)
-
-    # Display filtered results
-    if not filtered_records:
-        st.warning("沒有符合篩選條件的記錄。")
-        return
-
-    options = [f"{r['book_title']} - {r['article_title']} (頁 {r['page_number']}) - {r['model_used']} - {r['export_date']}" for r in filtered_records]
+    # 分頁顯示：只為當前頁建立標籤，前綴搜尋與排序都使用預先建立的索引
+    PAGE_SIZE = 20
+    sort_labels = {"匯出日期": "export_date", "頁碼": "page_number"}
+    c_search, c_sort = st.columns([2, 1])
+    with c_search:
+        search = st.text_input("搜尋書名或文章標題（開頭）", key="tab4_search")
+    with c_sort:
+        sort_label = st.radio("排序", list(sort_labels), horizontal=True, key="tab4_sort")
+
+    # 全文搜尋：課文、關鍵詞與字典（繁簡皆可），結果依相關度排序
+    fulltext = st.text_input("全文搜尋（課文、關鍵詞、字典）", key="tab4_fulltext")
+
+    # 到期複習：由排程堆積直接取出到期的課文（最逾期的排最前）
+    try:
+        due_records = [
+            r for r in store.due_records(records)
+            if all(v == "所有" or str(r.get(k, "")) == v for k, v in current_filters.items())
+        ]
+    except Exception as e:
+        st.warning(f"未能載入複習排程：{e}")
+        due_records = []
+    show_due = False
+    if due_records and not fulltext.strip() and not search.strip():
+        show_due = st.radio(
+            "課文清單", [f"到期複習（{len(due_records)}）", "全部課文"], horizontal=True, key="tab4_list",
+        ) != "全部課文"
+
+    if show_due:
+        page_records = due_records
+    elif fulltext.strip():
+        page_records = [
+            r for r in store.search(fulltext)
+            if all(v == "所有" or str(r.get(k, "")) == v for k, v in current_filters.items())
+        ]
+        if not page_records:
+            st.warning("沒有符合搜尋的記錄。")
+            return
+        st.caption(f"找到 {len(page_records)} 條相關記錄（依相關度排序）")
+    else:
+        total = facets.total(current_filters, search)
+
+        # Display filtered results
+        if not total:
+            st.warning("沒有符合篩選條件的記錄。")
+            return
+
+        pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        if st.session_state.get("tab4_page", 1) > pages:
+            st.session_state.tab4_page = pages
+        page = st.number_input(f"頁數（共 {pages} 頁，{total} 條記錄）", min_value=1, max_value=pages, step=1, key="tab4_page")
+        page_records, _ = facets.page(current_filters, search, sort_labels[sort_label], page, PAGE_SIZE)
+
+    options = [f"{r['book_title']} - {r['article_title']} (頁 {r['page_number']}) - {r['model_used']} - {r['export_date']}" for r in page_records]
     selected = st.selectbox("選擇要複習的課文", options=options)
     if not selected:
         return
     idx = options.index(selected)
-    data = filtered_records[idx]
+    meta = page_records[idx]
+    # Body columns (text / keywords / dictionary) are fetched for the selected record only
+    data = {**meta, **store.get_body(meta['record_id'], meta['export_date'])}
 
     if st.button("複製到<<課文學習>>和<<語音朗讀>>", key="copy_to_other_tabs"):
     # Save data to temporary files for other tabs
@@ -147,15 +184,39 @@ def render():
     st.write(data['keywords'])
 
     st.subheader("課文內容（關鍵詞高亮顯示）")
-    text_trad, text_simp = normalize_input_cached(data['original_text_trad'])
-    highlighted_trad, highlighted_simp = highlight_words_dual(text_trad, text_simp, data['keywords'])
     t1, t2 = st.tabs(["繁體中文", "簡體中文"])
     with t1:
-        st.markdown(highlighted_trad, unsafe_allow_html=True)
+        trad_box = st.container()
     with t2:
-        st.markdown(highlighted_simp, unsafe_allow_html=True)
+        simp_box = st.container()
+    # Archived lessons never change, so reopening one is a render-cache lookup;
+    # a miss still streams paragraph by paragraph
+    for highlighted_trad, highlighted_simp in get_render_cache().paragraphs(data['original_text_trad'], data['keywords']):
+        trad_box.markdown(highlighted_trad, unsafe_allow_html=True)
+        simp_box.markdown(highlighted_simp, unsafe_allow_html=True)
 
     st.subheader("字典解釋")
     st.markdown(f"*由 {data['model_used']} 生成*")
     st.markdown(data['dictionary_data'])
     st.info("如果你需要下載這個工作紙,您可以將此頁面打印為PDF。")
+
+    # 間隔重複：記錄這次複習的結果，下次複習時間由排程計算
+    st.subheader("複習結果")
+    try:
+        state = store.review_state(meta)
+    except Exception as e:
+        st.warning(f"未能載入複習排程：{e}")
+        return
+    if state:
+        st.caption(f"已複習 {state['reps']} 次，下次複習：{datetime.fromtimestamp(state['due'], pytz.timezone('Asia/Hong_Kong')).strftime('%Y-%m-%d %H:%M')}")
+    grade_labels = {"again": "忘記了", "hard": "困難", "good": "記得", "easy": "很容易"}
+    for col, (grade, label) in zip(st.columns(len(grade_labels)), grade_labels.items()):
+        with col:
+            if st.button(label, key=f"tab4_review_{grade}"):
+                try:
+                    saved = store.record_review(meta, grade)
+                except Exception as e:
+                    st.error(f"未能儲存複習結果：{e}")
+                    saved = None
+                if saved:
+                    st.rerun()
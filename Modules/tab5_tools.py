@@ -7,17 +7,31 @@
 # Notes:
 # - Uses file-based temp storage exactly like your original approach.
 # - TTS voice options & selection UI are centralized in tts.py (VOICE_CATALOG, voice_selectbox, synthesize_dual).
-# - If you keep only TTS, remove Tool 1 & 2 blocks and the `call_ai_model` import.
+# - If you keep only TTS, remove Tool 1 & 2 blocks and the `stream_ai_model` import.
 
 import os
 import streamlit as st
 from Modules.storage import save_to_temp_file, load_from_temp_file
-from Modules.ai import call_ai_model                     # Remove this import if you keep TTS-only
+from Modules.ai import stream_ai_model, last_ai_failed, ai_cache_stats, ai_singleflight_stats  # Remove this import if you keep TTS-only
 from Modules.tts import voice_selectbox, synthesize_dual, _voice_label # Centralized TTS helpers
 
 
 def render():
     st.header("🛠️ 工具")
+
+    # AI response cache: same prompt + model is answered from disk instead of the API
+    with st.expander("AI 快取"):
+        st.checkbox("略過快取（強制重新生成）", key="ai_cache_bypass")
+        stats = ai_cache_stats()
+        if stats:
+            st.caption(
+                f"命中 {stats['hits']} / 查詢 {stats['hits'] + stats['misses']}"
+                f"（命中率 {stats['hit_rate']:.0%}），節省約 {stats['saved_seconds']:.1f} 秒"
+            )
+        # identical requests from several sessions at once share one call
+        for kind, counts in ai_singleflight_stats().items():
+            st.caption(f"{kind.upper()} 合併請求：{counts['coalesced']} / {counts['calls']}")
+
     t1, t2, t3 = st.tabs(["繁簡轉換+字典", "雙向翻譯", "雙語發音"])
 
     # -------------------------------------------------------------------------
@@ -47,11 +61,11 @@ Column 5 & 6: "例句" (example in Traditional and Simplified Chinese)
 Text to convert: "{conversion_input}"
 Do not split the text arbitrarily; keep the original sentence structure.
 """
-                out = call_ai_model(prompt)
-                save_to_temp_file(out, "conversion_output.txt")
-
+                # Rendered as it streams in; the final text is kept for reruns
                 st.markdown("### 轉換結果")
-                st.markdown(out)
+                out = st.write_stream(stream_ai_model(prompt))
+                if not last_ai_failed():
+                    save_to_temp_file(out, "conversion_output.txt")
             else:
                 st.warning("請輸入文本")
         else:
@@ -102,11 +116,10 @@ Table 1: "Table 1: Full translation" with columns: "英文", "繁體", "簡體",
 Table 2: "Table 2: Breakdown of Translation" with columns: "英文", "繁體", "簡體", "拼音", "解釋", "例句"
 Use tone-mark pinyin (mā, má, mǎ, mà). Keep original passage format.
 """
-                out = call_ai_model(prompt)
-                save_to_temp_file(out, "translation_output.txt")
-
                 st.markdown("### 翻譯結果")
-                st.markdown(out)
+                out = st.write_stream(stream_ai_model(prompt))
+                if not last_ai_failed():
+                    save_to_temp_file(out, "translation_output.txt")
             else:
                 st.warning("請輸入要翻譯的文本")
         else:
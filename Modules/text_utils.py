@@ -1,61 +1,465 @@
 # text_utils.
 
-import unicodedata, re
+import os, unicodedata, re, threading, time, hashlib
+from collections import deque, OrderedDict, namedtuple
 from functools import lru_cache
 from opencc import OpenCC
 
-def normalize_input(text: str):
-    if not text or not isinstance(text, str):
-        return "", ""
+FULL_PUNCT_MAP = {
+    '!': '！', '"': '＂', '#': '＃', '$': '＄', '%':'％', '&':'＆', "'": '＇', '(':'（', ')':'）',
+    '*':'＊', '+':'＋', ',':'，', '-':'－', '.':'。', '/':'／', ':':'：', ';':'；', '<':'＜',
+    '=':'＝', '>':'＞', '?':'？', '@':'＠', '[':'［', '\\':'＼', ']':'］', '^':'＾',
+    '_':'＿', '`':'｀', '{':'｛', '|':'｜', '}':'｝', '~':'～',
+    '《':'〈', '》':'〉', '「':'『', '」':'』', '『':'「', '』':'」'
+}
+_PUNCT_TRANSLATOR = str.maketrans(FULL_PUNCT_MAP)
+
+
+ScriptGuess = namedtuple("ScriptGuess", "script confidence trad_count simp_count")
+
+
+class ScriptIndex:
+    """
+    Character sets taken from the OpenCC tables, built once per process.
+    - trad_only / simp_only: characters that only exist in one script, for classification
+    - s2t_changes / t2s_changes: every character a conversion could rewrite
+      (single characters plus those changed inside phrases), so text containing
+      none of them can skip that conversion entirely
+    If the tables are not shipped as text files (e.g. the C++ opencc build),
+    `available` is False and callers fall back to full conversion.
+    """
+
+    def __init__(self, dict_dir: str = None):
+        import opencc
+        dict_dir = dict_dir or os.path.join(os.path.dirname(opencc.__file__), 'dictionary')
+        self.trad_only = frozenset()
+        self.simp_only = frozenset()
+        self.s2t_changes = frozenset()
+        self.t2s_changes = frozenset()
+        self.available = False
+        try:
+            ts_chars = self._changed(os.path.join(dict_dir, 'TSCharacters.txt'))
+            st_chars = self._changed(os.path.join(dict_dir, 'STCharacters.txt'))
+            ts_phrases = self._changed(os.path.join(dict_dir, 'TSPhrases.txt'))
+            st_phrases = self._changed(os.path.join(dict_dir, 'STPhrases.txt'))
+        except OSError:
+            return
+        self.trad_only = frozenset(ts_chars - st_chars)
+        self.simp_only = frozenset(st_chars - ts_chars)
+        self.t2s_changes = frozenset(ts_chars | ts_phrases)
+        self.s2t_changes = frozenset(st_chars | st_phrases)
+        self.available = True
+
+    @staticmethod
+    def _changed(path: str) -> set:
+        """Characters of the dictionary keys that a lookup would actually change."""
+        changed = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, values = line.rstrip('\n').partition('\t')
+                first = values.split(' ')[0]
+                if len(key) == 1:
+                    if values.split(' ') != [key]:
+                        changed.add(key)
+                elif len(first) == len(key):
+                    changed.update(a for a, b in zip(key, first) if a != b)
+                else:
+                    changed.update(key)
+        return changed
+
+    def needs_conversion(self, text: str, config: str) -> bool:
+        if not self.available or config not in ('s2t', 't2s'):
+            return True
+        changes = self.s2t_changes if config == 's2t' else self.t2s_changes
+        return not changes.isdisjoint(text)
+
+    def classify(self, text: str) -> ScriptGuess:
+        """
+        Classify text as 'traditional', 'simplified' or 'neutral' (valid in both).
+        Confidence is the share of script-specific characters that agree with the verdict.
+        """
+        text = text or ""
+        trad = sum(map(self.trad_only.__contains__, text))
+        simp = sum(map(self.simp_only.__contains__, text))
+        if not trad and not simp:
+            return ScriptGuess("neutral", 1.0, 0, 0)
+        if trad >= simp:
+            return ScriptGuess("traditional", trad / (trad + simp), trad, simp)
+        return ScriptGuess("simplified", simp / (trad + simp), trad, simp)
+
+    def classify_batch(self, texts):
+        return [self.classify(t) for t in texts]
+
+
+_SCRIPT_INDEX = None
+_SCRIPT_INDEX_LOCK = threading.Lock()
+
+def get_script_index() -> ScriptIndex:
+    global _SCRIPT_INDEX
+    if _SCRIPT_INDEX is None:
+        with _SCRIPT_INDEX_LOCK:
+            if _SCRIPT_INDEX is None:
+                _SCRIPT_INDEX = ScriptIndex()
+    return _SCRIPT_INDEX
+
+def detect_script(text: str) -> ScriptGuess:
+    return get_script_index().classify(text)
+
+
+class ConversionEngine:
+    """
+    Process-wide OpenCC converters.
+    Each config ('t2s', 's2t') loads its dictionaries once and is then shared by
+    every session/thread; conversion itself is read-only so only loading is locked.
+    """
+
+    def __init__(self, max_timings: int = 256):
+        self._converters = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.loads = 0
+        self.calls = 0
+        self.skipped = 0
+        self.chars = 0
+        self.total_seconds = 0.0
+        self.timings = deque(maxlen=max_timings)  # (config, n_chars, seconds) per call
+
+    def get(self, config: str) -> OpenCC:
+        cc = self._converters.get(config)
+        if cc is None:
+            with self._lock:
+                cc = self._converters.get(config)
+                if cc is None:
+                    cc = OpenCC(config)
+                    cc.convert("")  # force dictionary load before sharing
+                    self._converters[config] = cc
+                    self.loads += 1
+        return cc
+
+    def convert(self, text: str, config: str) -> str:
+        if not get_script_index().needs_conversion(text, config):
+            # already in the target script, nothing for OpenCC to rewrite
+            with self._stats_lock:
+                self.skipped += 1
+            return text
+        cc = self.get(config)
+        start = time.perf_counter()
+        out = cc.convert(text)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.calls += 1
+            self.chars += len(text)
+            self.total_seconds += elapsed
+            self.timings.append((config, len(text), elapsed))
+        return out
+
+    def convert_pair(self, text: str):
+        """Return (traditional, simplified) for already-prepared text."""
+        return self.convert(text, 's2t'), self.convert(text, 't2s')
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "loads": self.loads,
+                "calls": self.calls,
+                "skipped": self.skipped,
+                "chars": self.chars,
+                "total_seconds": self.total_seconds,
+                "avg_ms": (self.total_seconds / self.calls * 1000) if self.calls else 0.0,
+                "last": list(self.timings)[-10:],
+            }
+
+
+_ENGINE = ConversionEngine()
+
+def get_conversion_engine() -> ConversionEngine:
+    return _ENGINE
+
+def _prepare_text(text: str) -> str:
     # preserve paragraph breaks, compact per-line whitespace
     lines = text.splitlines()
     cleaned = [' '.join(line.split()) for line in lines]
     text = '\n'.join(cleaned)
+    return unicodedata.normalize('NFKC', text).translate(_PUNCT_TRANSLATOR)
+
+def normalize_input(text: str):
+    if not text or not isinstance(text, str):
+        return "", ""
+    return _ENGINE.convert_pair(_prepare_text(text))
+
+def normalize_traditional(text: str) -> str:
+    """Traditional half of normalize_input, skipping the t2s conversion."""
+    if not text or not isinstance(text, str):
+        return ""
+    return _ENGINE.convert(_prepare_text(text), 's2t')
+
+def normalize_batch(texts):
+    """
+    Normalize a list of strings with one conversion per script.
+    Texts are joined on newlines (OpenCC never converts across them) and split back.
+    Returns a list of (traditional, simplified) pairs in input order.
+    """
+    prepared = [_prepare_text(t) if t and isinstance(t, str) else "" for t in texts]
+    if not any(prepared):
+        return [("", "") for _ in prepared]
+    joined = '\n'.join(prepared)
+    trad_lines, simp_lines = (s.split('\n') for s in _ENGINE.convert_pair(joined))
+    results, pos = [], 0
+    for p in prepared:
+        n = p.count('\n') + 1
+        results.append(('\n'.join(trad_lines[pos:pos + n]), '\n'.join(simp_lines[pos:pos + n])) if p else ("", ""))
+        pos += n
+    return results
+
+class NormalizationCache:
+    """
+    Process-level LRU of normalize_input results, shared by every session.
+    Keyed by a hash of the raw text and bounded by the UTF-8 size of the
+    stored (traditional, simplified) pairs rather than by entry count.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # digest -> (pair, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, text: str):
+        k = self.key(text)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None:
+                self._entries.move_to_end(k)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        pair = normalize_input(text)
+        size = len(pair[0].encode('utf-8')) + len(pair[1].encode('utf-8'))
+        if size > self.max_bytes:
+            return pair
+        with self._lock:
+            if k not in self._entries:
+                self._entries[k] = (pair, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, old_size) = self._entries.popitem(last=False)
+                    self.bytes -= old_size
+                    self.evictions += 1
+        return pair
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_NORMALIZE_CACHE = NormalizationCache()
+
+def get_normalization_cache() -> NormalizationCache:
+    return _NORMALIZE_CACHE
 
-    full_punct_map = {
-        '!': '！', '"': '＂', '#': '＃', '$': '＄', '%':'％', '&':'＆', "'": '＇', '(':'（', ')':'）',
-        '*':'＊', '+':'＋', ',':'，', '-':'－', '.':'。', '/':'／', ':':'：', ';':'；', '<':'＜',
-        '=':'＝', '>':'＞', '?':'？', '@':'＠', '[':'［', '\\':'＼', ']':'］', '^':'＾',
-        '_':'＿', '`':'｀', '{':'｛', '|':'｜', '}':'｝', '~':'～',
-        '《':'〈', '》':'〉', '「':'『', '」':'』', '『':'「', '』':'」'
-    }
-    translator = str.maketrans(full_punct_map)
-    text = unicodedata.normalize('NFKC', text).translate(translator)
-
-    cc_t2s = OpenCC('t2s')
-    cc_s2t = OpenCC('s2t')
-    simplified = cc_t2s.convert(text)
-    traditional = cc_s2t.convert(text)
-    return traditional, simplified
-
-@lru_cache(maxsize=16)
 def normalize_input_cached(text: str):
-    return normalize_input(text or "")
+    return _NORMALIZE_CACHE.get(text or "")
+
+def _iter_lines(source):
+    """Yield lines from a string (without copying it) or from any iterable of lines."""
+    if isinstance(source, str):
+        pos = 0
+        while True:
+            nl = source.find('\n', pos)
+            if nl < 0:
+                yield source[pos:].rstrip('\r')
+                return
+            yield source[pos:nl].rstrip('\r')
+            pos = nl + 1
+    else:
+        for line in source or ():
+            yield line.rstrip('\r\n')
+
+def iter_paragraphs(source):
+    """Yield raw, non-empty paragraphs (blank-line separated) one at a time."""
+    buf = []
+    for line in _iter_lines(source):
+        if line.strip():
+            buf.append(line)
+        elif buf:
+            yield '\n'.join(buf)
+            buf = []
+    if buf:
+        yield '\n'.join(buf)
+
+def normalize_stream(source):
+    """
+    Generator version of normalize_input for book-length input.
+    Accepts a string or an iterable of lines (e.g. an open file) and yields a
+    (traditional, simplified) pair per paragraph, so only one paragraph is
+    converted and held at a time.
+    """
+    for paragraph in iter_paragraphs(source):
+        yield normalize_input_cached(paragraph)
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a fixed keyword set.
+    One left-to-right scan finds every occurrence; overlaps are resolved
+    longest-first so markup is never nested or split.
+    """
+
+    def __init__(self, words):
+        self.words = tuple(dict.fromkeys(w for w in words if w))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]  # pattern lengths ending at each state
+        for w in self.words:
+            state = 0
+            for ch in w:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + (len(w),)
+        # breadth-first fail links; inherit outputs along the fail chain
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str):
+        """Yield (start, end) for every keyword occurrence, overlaps included."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for n in out[state]:
+                yield i + 1 - n, i + 1
+
+    def matches(self, text: str):
+        """Non-overlapping matches, longest first, returned in text order."""
+        if not self.words or not text:
+            return []
+        taken = bytearray(len(text))
+        chosen = []
+        for start, end in sorted(self.find_all(text), key=lambda m: (m[0] - m[1], m[0])):
+            if any(taken[start:end]):
+                continue
+            taken[start:end] = b'\x01' * (end - start)
+            chosen.append((start, end))
+        chosen.sort()
+        return chosen
+
+    def sub(self, text: str, repl) -> str:
+        """Replace every selected match with repl(matched_text) in one pass."""
+        parts, pos = [], 0
+        for start, end in self.matches(text):
+            parts.append(text[pos:start])
+            parts.append(repl(text[start:end]))
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=64)
+def get_keyword_automaton(words: tuple) -> KeywordAutomaton:
+    return KeywordAutomaton(words)
+
+def split_keywords(words_string: str):
+    unified = (words_string or "").replace("，", ",")
+    return [w.strip() for w in unified.split(",") if w.strip()]
+
+@lru_cache(maxsize=64)
+def _dual_automata(words: tuple):
+    pairs = normalize_batch(list(words))
+    return (get_keyword_automaton(tuple(t for t, _ in pairs)),
+            get_keyword_automaton(tuple(s for _, s in pairs)))
 
 def highlight_words_dual(text_trad, text_simp, words_string, highlight_style="background-color: #ffffcc;"):
     """
     Highlight words in both Traditional and Simplified texts using HTML spans.
+    Each text is scanned once by an automaton built (and cached) per keyword set.
     """
-    unified = (words_string or "").replace("，", ",")
-    words_raw = [w.strip() for w in unified.split(",") if w.strip()]
-    for w in words_raw:
-        trad, simp = normalize_input(w)  # ✅ direct call, no import needed
-        if trad:
-            text_trad = re.sub(
-                re.escape(trad),
-                f'<span style="{highlight_style}">{trad}</span>',
-                text_trad
-            )
-        if simp:
-            text_simp = re.sub(
-                re.escape(simp),
-                f'<span style="{highlight_style}">{simp}</span>',
-                text_simp
-            )
-    return text_trad, text_simp
-
-
-def is_traditional(text_input, text_trad, text_simp):
+    words_raw = split_keywords(words_string)
+    if not words_raw:
+        return text_trad, text_simp
+    trad_ac, simp_ac = _dual_automata(tuple(words_raw))
+    wrap = lambda w: f'<span style="{highlight_style}">{w}</span>'
+    return trad_ac.sub(text_trad or "", wrap), simp_ac.sub(text_simp or "", wrap)
+
+
+class ParagraphPipeline:
+    """
+    Incremental normalize + highlight for an edited passage.
+    Results are kept per paragraph, keyed by the paragraph's hash, so after an
+    edit only new or changed paragraphs are recomputed. Changing the keywords
+    invalidates the highlighted results (normalization stays cached).
+    """
+
+    def __init__(self, highlight_style: str = "background-color: #ffffcc;"):
+        self.highlight_style = highlight_style
+        self.words = None
+        self._results = {}  # paragraph digest -> (trad_html, simp_html)
+        self.recomputed = 0
+        self.reused = 0
+
+    def render(self, text, words_string=""):
+        """Yield highlighted (traditional, simplified) pairs per paragraph."""
+        if words_string != self.words:
+            self._results = {}
+            self.words = words_string
+        current = {}
+        for paragraph in iter_paragraphs(text):
+            k = NormalizationCache.key(paragraph)
+            result = current.get(k) or self._results.get(k)
+            if result is None:
+                trad, simp = normalize_input_cached(paragraph)
+                if words_string:
+                    trad, simp = highlight_words_dual(trad, simp, words_string, self.highlight_style)
+                result = (trad, simp)
+                self.recomputed += 1
+            else:
+                self.reused += 1
+            current[k] = result
+            yield result
+        # only keep paragraphs that are still in the passage
+        self._results = current
+
+
+def is_traditional(text_input, text_trad=None, text_simp=None):
+    index = get_script_index()
+    if index.available:
+        return index.classify(text_input).script != "simplified"
+    if text_trad is None or text_simp is None:
+        text_trad, text_simp = normalize_input_cached(text_input)
     trad_matches = sum(1 for a, b in zip(text_input, text_trad) if a == b)
     simp_matches = sum(1 for a, b in zip(text_input, text_simp) if a == b)
     return trad_matches >= simp_matches
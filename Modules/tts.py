@@ -1,7 +1,8 @@
 # tts.py
-import tempfile
+import shutil, tempfile
 import streamlit as st
 import azure.cognitiveservices.speech as speechsdk
+from Modules.singleflight import get_singleflight
 
 # ---------- Centralized voice catalog (edit here to add/remove voices) ----------
 VOICE_CATALOG = {
@@ -65,24 +66,16 @@ def _voice_label(voice_id: str) -> str:
     except Exception:
         return voice_id or ""
     
-# ---------- Azure TTS (unchanged) ----------
-def speak_text_azure(text: str, voice_id: str = None):
-    """Synthesize speech via Azure and return a temp .wav path or None."""
+# ---------- Azure TTS ----------
+def _synthesize_azure(text: str, voice_id: str, speech_key: str, speech_region: str, speech_endpoint: str):
+    """(temp .wav path, None) or (None, error message); no Streamlit calls, so it can be shared."""
     try:
-        speech_key = st.secrets.get("AZURE_SPEECH_KEY")
-        speech_region = st.secrets.get("AZURE_SPEECH_REGION")
-        speech_endpoint = st.secrets.get("AZURE_SPEECH_ENDPOINT", "")
-
-        if not speech_key:
-            st.error("Azure語音服務未配置。請在 secrets 設定 AZURE_SPEECH_KEY")
-            return None
-
         if speech_endpoint:
             speech_config = speechsdk.SpeechConfig(endpoint=speech_endpoint, subscription=speech_key)
         else:
             speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
 
-        speech_config.speech_synthesis_voice_name = voice_id or "zh-CN-XiaoxiaoNeural"
+        speech_config.speech_synthesis_voice_name = voice_id
 
         with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
             out_path = fp.name
@@ -92,18 +85,50 @@ def speak_text_azure(text: str, voice_id: str = None):
         result = synthesizer.speak_text_async(text).get()
 
         if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            return out_path
+            return out_path, None
 
         cancellation = result.cancellation_details
         msg = f"語音合成失敗: {cancellation.reason}"
         if cancellation.reason == speechsdk.CancellationReason.Error:
             msg += f"\n錯誤詳情: {cancellation.error_details}"
-        st.error(msg)
-        return None
+        return None, msg
 
     except Exception as e:
-        st.error(f"Azure語音服務錯誤: {e}")
+        return None, f"Azure語音服務錯誤: {e}"
+
+def speak_text_azure(text: str, voice_id: str = None):
+    """Synthesize speech via Azure and return a temp .wav path or None."""
+    speech_key = st.secrets.get("AZURE_SPEECH_KEY")
+    if not speech_key:
+        st.error("Azure語音服務未配置。請在 secrets 設定 AZURE_SPEECH_KEY")
         return None
+    voice_id = voice_id or "zh-CN-XiaoxiaoNeural"
+    args = (text, voice_id, speech_key, st.secrets.get("AZURE_SPEECH_REGION"), st.secrets.get("AZURE_SPEECH_ENDPOINT", ""))
+
+    # identical text/voice requests already in flight in other sessions share one synthesis
+    flights, key = get_singleflight(), (text, voice_id)
+    flight, leader = flights.acquire("tts", key)
+    if leader:
+        result = (None, "語音合成中斷")
+        try:
+            result = _synthesize_azure(*args)
+        finally:
+            flights.release("tts", key, flight, result=result)
+        path, error = result
+    else:
+        path, error = flights.wait(flight)
+        if path:
+            # every session gets its own file, since tab 5 can delete its copy
+            try:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
+                    copy_path = fp.name
+                shutil.copyfile(path, copy_path)
+                path = copy_path
+            except OSError as e:
+                path, error = None, f"Azure語音服務錯誤: {e}"
+    if error:
+        st.error(error)
+    return path
 
 # ---------- NEW: one-shot dual synthesis ----------
 def _resolve_voice(language: str, provided_id: str | None) -> str | None:
@@ -0,0 +1,254 @@
+# write_queue.py
+# Write-behind queue for Google Sheets exports.
+# - save_to_gs() enqueues upserts instead of making a blocking round trip
+# - a background worker flushes them with batch_update / append_rows
+#   once `max_batch` writes are pending or the oldest has waited `max_delay` seconds
+# - readers merge pending (and recently flushed) writes into their snapshot
+# - appended rows land wherever the sheet ends (another worker may have appended first),
+#   so the real rows are read from the append response and reported through `on_append`
+# - an append that failed with anything but a 429 may still have landed; before it is
+#   retried the sheet is searched for it, and a row found there is updated instead
+# No Streamlit calls here: the worker runs outside any script run.
+
+import re, threading, time, atexit
+from collections import OrderedDict
+from Modules.sheets_client import is_rate_limited
+
+COLUMNS = ["export_date", "book_title", "article_title", "page_number",
+           "original_text_trad", "keywords", "dictionary_data", "model_used"]
+LAST_COLUMN = chr(ord("A") + len(COLUMNS) - 1)
+KEY_COLUMNS = ("book_title", "article_title", "model_used")
+_RANGE_START = re.compile(r"![A-Z]+(\d+)")
+
+
+def appended_start_row(response):
+    """First row written by an append_rows call, from its `updates.updatedRange`, or None."""
+    try:
+        match = _RANGE_START.search(response["updates"]["updatedRange"])
+    except (TypeError, KeyError):
+        return None
+    return int(match.group(1)) if match else None
+
+
+class WriteBehindQueue:
+    def __init__(self, sheet, max_batch: int = 20, max_delay: float = 2.0, retry_delay: float = 5.0,
+                 on_append=None):
+        self.sheet = sheet
+        # on_append([(guessed_row, actual_row, record), ...]) after every successful append
+        self.on_append = on_append
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()   # row -> (record, is_append, enqueued_at)
+        self._flushed = {}              # row -> (record, flushed_at), until a newer snapshot covers it
+        self._unconfirmed = set()       # appended rows whose last attempt may have landed anyway
+        self._worker = None
+        self._stopped = False
+        # status
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = ""
+        self.last_flush_at = None
+        self.last_flush_latency = 0.0
+
+    # ---------- producer side ----------
+    def enqueue(self, row: int, record: dict, is_append: bool):
+        """Queue an upsert of `record` at sheet `row`; a later write to the same row replaces it."""
+        with self._cond:
+            prev = self._pending.pop(row, None)
+            is_append = is_append or bool(prev and prev[1])
+            enqueued_at = prev[2] if prev else time.monotonic()
+            self._pending[row] = (dict(record), is_append, enqueued_at)
+            self.enqueued += 1
+            self._ensure_worker()
+            self._cond.notify()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def overlay(self, snapshot_fetched_at: float = 0.0) -> dict:
+        """
+        row -> record for writes a snapshot fetched at `snapshot_fetched_at` may not contain.
+        Flushed writes older than the snapshot are dropped here.
+        """
+        with self._cond:
+            self._flushed = {r: v for r, v in self._flushed.items() if v[1] >= snapshot_fetched_at}
+            merged = {r: rec for r, (rec, _) in self._flushed.items()}
+            merged.update({r: rec for r, (rec, _, _) in self._pending.items()})
+            return merged
+
+    def merge_into(self, records: list, snapshot_fetched_at: float = 0.0) -> list:
+        """
+        Return a copy of `records` with queued writes applied (row N -> records[N - 2]).
+        Rows between the snapshot and a queued row (written by another worker) are `{}`
+        placeholders, so every record keeps its row position.
+        """
+        overlay = self.overlay(snapshot_fetched_at)
+        if not overlay:
+            return records
+        merged = list(records)
+        for row in sorted(overlay):
+            pos = row - 2  # header + 1-based
+            if pos < len(merged):
+                merged[pos] = overlay[row]
+            else:
+                merged.extend({} for _ in range(pos - len(merged)))
+                merged.append(overlay[row])
+        return merged
+
+    # ---------- consumer side ----------
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="sheets-write-behind", daemon=True)
+            self._worker.start()
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        if len(self._pending) >= self.max_batch:
+            return True
+        oldest = next(iter(self._pending.values()))[2]
+        return time.monotonic() - oldest >= self.max_delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._due():
+                    if self._pending:
+                        oldest = next(iter(self._pending.values()))[2]
+                        self._cond.wait(max(0.0, self.max_delay - (time.monotonic() - oldest)))
+                    else:
+                        self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+            if not self.flush() and not self._stopped:
+                time.sleep(self.retry_delay)
+
+    def flush(self) -> bool:
+        """Write every pending upsert now. Returns False (and re-queues) on failure."""
+        with self._cond:
+            if not self._pending:
+                return True
+            batch = self._pending
+            self._pending = OrderedDict()
+
+        updates = [(r, rec) for r, (rec, is_append, _) in batch.items() if not is_append]
+        appends = sorted((r, rec) for r, (rec, is_append, _) in batch.items() if is_append)
+        start = time.perf_counter()
+        relocated = []
+        appending = False
+        try:
+            with self._cond:
+                unconfirmed = [(r, rec) for r, rec in appends if r in self._unconfirmed]
+            if unconfirmed:
+                landed = self._find_landed(unconfirmed)
+                for r, rec in unconfirmed:
+                    if r in landed:
+                        updates.append((landed[r], rec))
+                        relocated.append((r, landed[r], rec))
+                appends = [(r, rec) for r, rec in appends if r not in landed]
+            if updates:
+                self.sheet.batch_update([
+                    {"range": f"A{r}:{LAST_COLUMN}{r}", "values": [[rec.get(c, "") for c in COLUMNS]]}
+                    for r, rec in updates
+                ])
+            if appends:
+                appending = True
+                response = self.sheet.append_rows([[rec.get(c, "") for c in COLUMNS] for _, rec in appends])
+                first = appended_start_row(response)
+                if first is not None:
+                    relocated += [(r, first + i, rec) for i, (r, rec) in enumerate(appends)]
+        except Exception as e:
+            with self._cond:
+                if appending and not is_rate_limited(e):
+                    self._unconfirmed.update(r for r, _ in appends)
+                # put the batch back in front of anything queued meanwhile
+                for r, (rec, is_append, enqueued_at) in self._pending.items():
+                    prev = batch.pop(r, None)
+                    batch[r] = (rec, is_append or bool(prev and prev[1]), prev[2] if prev else enqueued_at)
+                self._pending = batch
+                self.failures += 1
+                self.last_error = str(e)
+            return False
+
+        now = time.time()
+        moved = {guess: actual for guess, actual, _ in relocated if guess != actual}
+        with self._cond:
+            self._unconfirmed.difference_update(batch)
+            for r, (rec, _, _) in batch.items():
+                self._flushed[moved.get(r, r)] = (rec, now)
+            # writes queued for a guessed row while this batch was in flight follow it
+            for guess, actual in moved.items():
+                if guess in self._pending:
+                    rec, _, enqueued_at = self._pending.pop(guess)
+                    if actual in self._pending:
+                        # a newer append had guessed the real row: give it another placeholder
+                        spare = max(list(self._pending) + list(self._flushed)) + 1
+                        self._pending[spare] = self._pending.pop(actual)
+                    self._pending[actual] = (rec, False, enqueued_at)
+            self.flushed += len(batch)
+            self.batches += 1
+            self.last_error = ""
+            self.last_flush_at = now
+            self.last_flush_latency = time.perf_counter() - start
+        if relocated and self.on_append is not None:
+            try:
+                self.on_append(relocated)
+            except Exception as e:
+                with self._cond:
+                    self.last_error = str(e)
+        return True
+
+    def _find_landed(self, appends: list) -> dict:
+        """guessed row -> sheet row for appends whose (book, article, model) is already in the sheet."""
+        rows = self.sheet.get_all_values()
+        cols = [COLUMNS.index(c) for c in KEY_COLUMNS]
+        found = {}
+        for i, values in enumerate(rows[1:], start=2):
+            values = values + [""] * (len(COLUMNS) - len(values))
+            found[tuple(str(values[c]).strip() for c in cols)] = i  # last match wins
+        landed = {}
+        for r, rec in appends:
+            row = found.get(tuple(str(rec.get(c, "")).strip() for c in KEY_COLUMNS))
+            if row is not None:
+                landed[r] = row
+        return landed
+
+    def stop(self, flush: bool = True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if flush:
+            self.flush()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "last_flush_at": self.last_flush_at,
+                "last_flush_latency": self.last_flush_latency,
+            }
+
+
+_QUEUES = []
+
+@atexit.register
+def _flush_all():
+    for q in _QUEUES:
+        try:
+            q.stop(flush=True)
+        except Exception:
+            pass
+
+def register_queue(queue: WriteBehindQueue) -> WriteBehindQueue:
+    _QUEUES.append(queue)
+    return queue
@@ -0,0 +1,73 @@
+# gather_ai / run_ai_batch in Modules/ai.py against a stub provider manager.
+
+import asyncio, os, sys, threading, time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("streamlit")
+from Modules import ai
+
+
+class StubManager:
+    """complete() answers after `delay` seconds and tracks how many calls overlap."""
+
+    def __init__(self, delay: float = 0.05, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, provider, hedge_after=None, failover=True):
+        with self._lock:
+            self.calls.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            # later prompts answer first, so ordering comes from gather_ai, not timing
+            time.sleep(self.delay / (1 + len(self.calls)))
+            if prompt in self.fail:
+                raise RuntimeError(f"provider failed on {prompt}")
+            return f"answer {prompt}", provider
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    stub = StubManager()
+    monkeypatch.setattr(ai, "get_client_manager", lambda: stub)
+    monkeypatch.setattr(ai, "ai_cache_enabled", lambda: False)
+    monkeypatch.setattr(ai, "_routing", lambda: {"failover": True, "hedge_after": None})
+    return stub
+
+
+def test_answers_keep_prompt_order(manager):
+    prompts = [f"p{i}" for i in range(8)]
+    answers = asyncio.run(ai.gather_ai(prompts, limit=8, provider="Gemini"))
+    assert answers == [f"answer {p}" for p in prompts]
+
+
+def test_concurrency_limit(manager):
+    manager.delay = 0.1
+    asyncio.run(ai.gather_ai([f"p{i}" for i in range(9)], limit=3, provider="DeepSeek"))
+    assert len(manager.calls) == 9
+    assert 1 < manager.max_active <= 3
+
+
+def test_errors_are_returned_in_place(manager):
+    manager.fail = {"p1"}
+    answers = asyncio.run(ai.gather_ai(["p0", "p1", "p2"], limit=2, provider="Gemini"))
+    assert answers[0] == "answer p0" and answers[2] == "answer p2"
+    assert ai.is_error_response(answers[1])
+
+
+def test_identical_prompts_share_one_call(manager):
+    manager.delay = 0.2
+    answers = asyncio.run(ai.gather_ai(["same"] * 4 + ["other"], limit=5, provider="Gemini"))
+    assert answers == ["answer same"] * 4 + ["answer other"]
+    assert sorted(manager.calls) == ["other", "same"]
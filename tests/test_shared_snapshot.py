@@ -0,0 +1,154 @@
+# Concurrent readers of Modules/shared_snapshot.py while the snapshot is being replaced.
+
+import multiprocessing, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.shared_snapshot import SharedSnapshot
+
+META = ["book_title", "article_title"]
+
+
+def _records(version: int, count: int = 50) -> list:
+    # every record of one write carries the same version, so a torn read is detectable
+    return [{"book_title": f"v{version}", "article_title": f"a{i}", "body": "字" * (i * 40)}
+            for i in range(count)]
+
+
+def _check_consistent(view):
+    versions = {view.record(i)["book_title"] for i in range(len(view))}
+    assert len(versions) == 1, versions
+    assert {view.meta(i)["book_title"] for i in range(len(view))} == versions
+    return versions.pop()
+
+
+def test_readers_see_whole_versions_while_writer_replaces(tmp_path):
+    path = str(tmp_path / "records.snapshot")
+    writer = SharedSnapshot(path, META)
+    writer.write(_records(0))
+    stop = threading.Event()
+    errors = []
+    seen = set()
+
+    def read_loop():
+        # one SharedSnapshot per thread, like separate sessions / processes on the host
+        reader = SharedSnapshot(path, META)
+        try:
+            while not stop.is_set():
+                view = reader.read()
+                assert view is not None
+                seen.add(_check_consistent(view))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read_loop) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for v in range(1, 30):
+        writer.write(_records(v, count=20 + v))
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    assert writer.read().version == 30
+
+
+def test_shared_reader_serves_old_view_during_write(tmp_path):
+    path = str(tmp_path / "records.snapshot")
+    snap = SharedSnapshot(path, META)
+    snap.write(_records(0))
+    old = snap.read()
+    stop = threading.Event()
+    errors = []
+
+    def read_loop():
+        try:
+            while not stop.is_set():
+                _check_consistent(snap.read())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read_loop) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for v in range(1, 20):
+        snap.write(_records(v))
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    # a view handed out before the writes stays readable after the file was replaced
+    assert _check_consistent(old) == "v0"
+    assert _check_consistent(snap.read()) == "v19"
+
+
+def test_refresh_if_stale_fetches_once_across_threads(tmp_path):
+    path = str(tmp_path / "records.snapshot")
+    SharedSnapshot(path, META).write(_records(0), created_at=time.time() - 60)
+    calls = []
+    started = threading.Barrier(6)
+    results = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)  # long enough for every other thread to hit the lock
+        return _records(1)
+
+    def refresh():
+        snap = SharedSnapshot(path, META)
+        started.wait()
+        results.append(_check_consistent(snap.refresh_if_stale(fetch, max_age=30)))
+
+    threads = [threading.Thread(target=refresh) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    # losers of the lock keep serving the stale snapshot instead of waiting
+    assert set(results) <= {"v0", "v1"} and "v1" in results
+    assert _check_consistent(SharedSnapshot(path, META).read()) == "v1"
+
+
+def _process_refresh(path, counter, barrier, out):
+    def fetch():
+        with counter.get_lock():
+            counter.value += 1
+        time.sleep(0.3)
+        return _records(1)
+
+    snap = SharedSnapshot(path, META)
+    barrier.wait()
+    out.put(_check_consistent(snap.refresh_if_stale(fetch, max_age=30)))
+
+
+def _process_read(path, stop, out):
+    snap = SharedSnapshot(path, META)
+    seen = set()
+    while not stop.is_set():
+        seen.add(_check_consistent(snap.read()))
+    out.put(sorted(seen))
+
+
+def test_processes_read_and_refresh_concurrently(tmp_path):
+    path = str(tmp_path / "records.snapshot")
+    SharedSnapshot(path, META).write(_records(0), created_at=time.time() - 60)
+    ctx = multiprocessing.get_context("spawn" if sys.platform == "win32" else "fork")
+    counter = ctx.Value("i", 0)
+    barrier = ctx.Barrier(4)
+    stop = ctx.Event()
+    out = ctx.Queue()
+    readers = [ctx.Process(target=_process_read, args=(path, stop, out)) for _ in range(2)]
+    refreshers = [ctx.Process(target=_process_refresh, args=(path, counter, barrier, out)) for _ in range(4)]
+    for p in readers + refreshers:
+        p.start()
+    for p in refreshers:
+        p.join(30)
+    stop.set()
+    for p in readers:
+        p.join(30)
+    results = [out.get(timeout=10) for _ in readers + refreshers]
+    assert all(p.exitcode == 0 for p in readers + refreshers)
+    assert counter.value == 1
+    assert _check_consistent(SharedSnapshot(path, META).read()) == "v1"
+    assert all(r in ("v0", "v1") for r in results if isinstance(r, str))
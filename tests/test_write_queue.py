@@ -0,0 +1,129 @@
+# Modules/write_queue.py against an in-memory fake of the gspread worksheet.
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.write_queue import COLUMNS, WriteBehindQueue, appended_start_row
+
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"APIError [{status_code}]")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+class FakeSheet:
+    """Rows as lists of strings; `failures` are raised by the next append_rows calls."""
+
+    def __init__(self, rows=()):
+        self.rows = [list(COLUMNS)] + [list(r) for r in rows]
+        self.failures = []  # (status_code, lands): lands=True writes the rows before failing
+        self.appends = 0
+        self.on_append = None
+
+    def append_rows(self, values):
+        self.appends += 1
+        if self.on_append:
+            self.on_append()
+        start = len(self.rows) + 1
+        if self.failures:
+            code, lands = self.failures.pop(0)
+            if lands:
+                self.rows += [list(v) for v in values]
+            raise APIError(code)
+        self.rows += [list(v) for v in values]
+        return {"updates": {"updatedRange": f"Sheet1!A{start}:H{start + len(values) - 1}"}}
+
+    def batch_update(self, data):
+        for item in data:
+            row = int(item["range"].split(":")[0][1:])
+            self.rows[row - 1] = list(item["values"][0])
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+
+def _record(title: str, model: str = "Gemini") -> dict:
+    return {c: "" for c in COLUMNS} | {"book_title": "book", "article_title": title, "model_used": model}
+
+
+def _row(title: str) -> list:
+    return [_record(title).get(c, "") for c in COLUMNS]
+
+
+def _queue(sheet, relocated=None):
+    # no automatic flushes: the tests call flush() themselves
+    return WriteBehindQueue(sheet, max_batch=1000, max_delay=3600,
+                            on_append=relocated.extend if relocated is not None else None)
+
+
+def test_appended_start_row():
+    assert appended_start_row({"updates": {"updatedRange": "Sheet1!A7:H8"}}) == 7
+    assert appended_start_row({"updates": {"updatedRange": "'my sheet'!A12:H12"}}) == 12
+    assert appended_start_row(None) is None
+    assert appended_start_row({}) is None
+
+
+def test_append_is_relocated_to_the_row_it_landed_on():
+    # another worker appended two rows after this process took its snapshot
+    sheet = FakeSheet([_row("a"), _row("other 1"), _row("other 2")])
+    relocated = []
+    queue = _queue(sheet, relocated)
+    queue.enqueue(3, _record("b"), is_append=True)  # guessed from a one-row snapshot
+    assert queue.flush()
+    assert [(g, a) for g, a, _ in relocated] == [(3, 5)]
+    assert sheet.rows[4] == _row("b")
+    assert set(queue.overlay()) == {5}
+
+
+def test_write_queued_during_flush_follows_the_relocated_append():
+    sheet = FakeSheet([_row("a"), _row("other")])
+    queue = _queue(sheet)
+    queue.enqueue(3, _record("b"), is_append=True)
+    # an overwrite of the same lesson arrives while the append is in flight
+    sheet.on_append = lambda: queue.enqueue(3, _record("b") | {"keywords": "new"}, is_append=False)
+    assert queue.flush()
+    sheet.on_append = None
+    assert queue.flush()
+    assert sheet.rows[3][COLUMNS.index("keywords")] == "new"
+    assert sheet.rows[2] == _row("other")  # the other worker's row is untouched
+    assert len(sheet.rows) == 4
+
+
+def test_append_that_landed_before_a_5xx_is_not_appended_again():
+    sheet = FakeSheet([_row("a")])
+    sheet.failures = [(503, True)]
+    relocated = []
+    queue = _queue(sheet, relocated)
+    queue.enqueue(3, _record("b"), is_append=True)
+    assert not queue.flush()
+    assert queue.pending_count() == 1
+    assert queue.flush()
+    assert sheet.appends == 1
+    assert [r[COLUMNS.index("article_title")] for r in sheet.rows[1:]] == ["a", "b"]
+    assert [(g, a) for g, a, _ in relocated] == [(3, 3)]
+
+
+def test_rate_limited_append_is_sent_again():
+    sheet = FakeSheet([_row("a")])
+    sheet.failures = [(429, False)]
+    queue = _queue(sheet)
+    queue.enqueue(3, _record("b"), is_append=True)
+    assert not queue.flush()
+    assert queue.flush()
+    assert sheet.appends == 2
+    assert sheet.rows[2] == _row("b")
+
+
+def test_merge_keeps_row_positions_across_gaps():
+    sheet = FakeSheet([_row("a"), _row("other")])
+    queue = _queue(sheet)
+    # guessed from a one-row snapshot; another worker's row 3 pushes them to 4 and 5
+    queue.enqueue(3, _record("b"), is_append=True)
+    queue.enqueue(4, _record("c"), is_append=True)
+    assert queue.flush()
+    merged = queue.merge_into([_record("a")])
+    assert [r.get("article_title") for r in merged] == ["a", None, "b", "c"]
+    rows = {i + 2: r["article_title"] for i, r in enumerate(merged) if r}
+    assert rows == {2: "a", 4: "b", 5: "c"}